@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+# Tesseract (OpenMP) would otherwise grab every core per call; OCR parallelism comes
+# from the thread pools in core.views / core.ocr instead.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "django.middleware.gzip.GZipMiddleware",  # compress JSON for mobile clients
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -51,6 +57,30 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 ]
 
+# Shared cache for product lookups. Set REDIS_URL (e.g. redis://localhost:6379/1) to share
+# it across workers; the default per-process memory cache needs no extra services.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer",  # orjson when installed, DRF's encoder otherwise
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 ROOT_URLCONF = "backend.urls"
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -0,0 +1,87 @@
+# core/llm_cache.py
+import os, json, time, sqlite3, threading
+from pathlib import Path
+from typing import Dict, Optional, Any
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DEFAULT_DB_PATH = DATA_DIR / "llm_cache.db"
+
+TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "7"))
+PRUNE_EVERY = 500  # writes between sweeps of expired rows (plus one sweep on first connect)
+
+
+class LLMCache:
+    """
+    Tiny SQLite-backed store for normalized LLM payloads, keyed by a content hash.
+    Never raises: a broken/locked cache just behaves like a miss.
+    Expired rows are deleted on first connect and every PRUNE_EVERY writes, so the file stays bounded.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl_days: float = TTL_DAYS):
+        self.path = Path(path or DEFAULT_DB_PATH)
+        self.ttl_seconds = ttl_days * 86400.0
+        self._ready = False
+        self._writes = 0
+        self._lock = threading.Lock()  # workers share one instance across threads
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._ready:
+            return sqlite3.connect(str(self.path), timeout=2.0)
+        with self._lock:  # first connect: create the table and sweep exactly once
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=2.0)
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY,"
+                    " payload JSON NOT NULL,"
+                    " created_at REAL NOT NULL)"
+                )
+                with conn:
+                    self._prune(conn)
+                self._ready = True
+            return conn
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        if self.ttl_seconds > 0:
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT payload, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception:
+            return None
+        if not row:
+            return None
+        payload, created_at = row
+        if self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds:
+            return None
+        try:
+            return json.loads(payload)
+        except Exception:
+            return None
+
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, payload, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(payload), time.time()),
+                    )
+                    with self._lock:
+                        self._writes += 1
+                        due = self._writes % PRUNE_EVERY == 0
+                    if due:
+                        self._prune(conn)
+            finally:
+                conn.close()
+        except Exception:
+            pass  # caching is best-effort
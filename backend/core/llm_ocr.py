@@ -1,10 +1,34 @@
 # core/llm_ocr.py
-import os, io, base64, json, math
+import os, io, base64, json, math, hashlib
 from typing import Dict, Tuple, Optional, Any
 from PIL import Image
 
+from core.llm_cache import LLMCache
+
 USE_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
+# Upload size: labels stay legible well below phone-camera resolution
+MAX_DIM = int(os.getenv("GEMINI_MAX_DIM", "1024"))
+JPEG_QUALITY = int(os.getenv("GEMINI_JPEG_QUALITY", "85"))
+
+# Bump whenever PROMPT or the normalization below changes, so cached payloads are invalidated
+PROMPT_VERSION = "1"
+
+_CACHE = LLMCache()
+
+# SDK import + configure + model construction happen once per process (per API key)
+_MODEL_SINGLETON: Optional[Any] = None
+_MODEL_API_KEY: Optional[str] = None
+
+def _get_model(api_key: str) -> Any:
+    global _MODEL_SINGLETON, _MODEL_API_KEY
+    if _MODEL_SINGLETON is None or _MODEL_API_KEY != api_key:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _MODEL_SINGLETON = genai.GenerativeModel(USE_MODEL)
+        _MODEL_API_KEY = api_key
+    return _MODEL_SINGLETON
+
 PROMPT = """You read a photo of a packaged food label.
 Return ONLY JSON matching this schema (no extra text):
 
@@ -37,49 +61,74 @@ Rules:
 - Ingredients: normalize punctuation, keep commas between items, drop nutrition table and addresses.
 """
 
-def _pil_to_b64_jpeg(img: Image.Image, quality: int = 90) -> str:
+def _cache_key(img: Image.Image, raw_jpeg: Optional[bytes] = None) -> str:
+    h = hashlib.sha256()
+    if raw_jpeg is not None:
+        # Hashing the encoded upload is much cheaper than materializing all pixels
+        h.update(f"raw:{MAX_DIM}:{JPEG_QUALITY}:".encode())
+        h.update(raw_jpeg)
+    else:
+        h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:{MAX_DIM}:{JPEG_QUALITY}:".encode())
+        h.update(img.tobytes())
+    h.update(USE_MODEL.encode())
+    h.update(PROMPT_VERSION.encode())
+    return h.hexdigest()
+
+def _pil_to_b64_jpeg(img: Image.Image, quality: int = JPEG_QUALITY, max_dim: int = MAX_DIM) -> str:
+    if max_dim > 0 and max(img.size) > max_dim:
+        img = img.copy()
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
     buf = io.BytesIO()
     img.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True)
     return base64.b64encode(buf.getvalue()).decode("ascii")
 
+_COMMA_TRANS = str.maketrans({",": "."})  # decimal comma → dot
+
 def _parse_num(x: Any) -> Optional[float]:
     try:
         if x is None:
             return None
-        s = str(x).strip().replace(",", ".")
-        return float(s)
+        return float(str(x).strip().translate(_COMMA_TRANS))
     except Exception:
         return None
 
-def _to_mg(value: Optional[float], unit: Optional[str]) -> Optional[float]:
-    if value is None or not unit:
-        return None
-    u = unit.lower()
-    if u == "mg":
-        return value
-    if u == "g":
-        return value * 1000.0
-    return None
-
-def _to_g(value: Optional[float], unit: Optional[str]) -> Optional[float]:
+# (unit as labelled, target unit) → (multiplier, divisor). Down-conversions divide rather than
+# multiply by 0.001, which isn't exact in binary (9 mg would come out as 0.009000000000000001 g).
+_UNIT_FACTORS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ("g", "g"): (1.0, 1.0),
+    ("mg", "g"): (1.0, 1000.0),
+    ("g", "mg"): (1000.0, 1.0),
+    ("mg", "mg"): (1.0, 1.0),
+    ("kj", "kj"): (1.0, 1.0),
+    ("kcal", "kj"): (4.184, 1.0),
+}
+
+def _convert(value: Optional[float], unit: Optional[str], target: str) -> Optional[float]:
+    """
+    Convert value from its labelled unit to target ("g", "mg" or "kj"); None if unknown.
+    """
     if value is None or not unit:
         return None
-    u = unit.lower()
-    if u == "g":
-        return value
-    if u == "mg":
-        return value / 1000.0
-    return None
-
-def _energy_to_kj(value: Optional[float], unit: Optional[str]) -> Optional[float]:
-    if value is None or not unit:
+    factors = _UNIT_FACTORS.get((unit.lower(), target))
+    if factors is None:
         return None
-    u = unit.lower()
-    if u == "kj":
-        return value
-    if u == "kcal":
-        return value * 4.184
-    return None
+    mul, div = factors
+    if mul != 1.0:
+        return value * mul
+    return value / div if div != 1.0 else value
+
+# (model key, output key, target unit); every nutrient except fruit_pct is scaled to per-100
+_NUTRIENT_SPECS = (
+    ("energy", "energy_kj", "kj"),
+    ("sugars", "sugar_g", "g"),
+    ("sodium", "sodium_mg", "mg"),
+    ("saturated_fat", "sat_fat_g", "g"),
+    ("trans_fat", "trans_fat_g", "g"),
+    ("fiber", "fiber_g", "g"),
+    ("protein", "protein_g", "g"),
+)
+
+_EMPTY: Dict[str, Any] = {}  # shared stand-in for missing sub-blocks; never mutated
 
 def _normalize_nutrition(block: Dict[str, Any]) -> Dict[str, Optional[float]]:
     """
@@ -87,80 +136,62 @@ def _normalize_nutrition(block: Dict[str, Any]) -> Dict[str, Optional[float]]:
     If basis is per_serving and serving size is known, we approximate per 100.
     """
     basis = (block.get("basis") or "unknown").lower()
-    serving = block.get("serving_size") or {}
+    serving = block.get("serving_size") or _EMPTY
     sv, su = _parse_num(serving.get("value")), (serving.get("unit") or "").lower()
 
-    # Helpers to scale to per 100 g/ml if needed
-    def scale_to_100(v: Optional[float]) -> Optional[float]:
-        if v is None:
-            return None
-        if basis in ("per_100g", "per_100ml"):
-            return v
-        if basis == "per_serving" and sv and su in ("g", "ml") and sv > 0:
-            return v * (100.0 / sv)
-        # unknown: just return as-is
-        return v
-
-    energy_kj = _energy_to_kj(_parse_num((block.get("energy") or {}).get("value")),
-                              (block.get("energy") or {}).get("unit"))
-
-    sugars_g = _to_g(_parse_num((block.get("sugars") or {}).get("value")),
-                     (block.get("sugars") or {}).get("unit"))
-    sodium_mg = _to_mg(_parse_num((block.get("sodium") or {}).get("value")),
-                       (block.get("sodium") or {}).get("unit"))
-    sat_fat_g = _to_g(_parse_num((block.get("saturated_fat") or {}).get("value")),
-                      (block.get("saturated_fat") or {}).get("unit"))
-    trans_fat_g = _to_g(_parse_num((block.get("trans_fat") or {}).get("value")),
-                        (block.get("trans_fat") or {}).get("unit"))
-    fiber_g = _to_g(_parse_num((block.get("fiber") or {}).get("value")),
-                    (block.get("fiber") or {}).get("unit"))
-    protein_g = _to_g(_parse_num((block.get("protein") or {}).get("value")),
-                      (block.get("protein") or {}).get("unit"))
-    fruit_pct = _parse_num((block.get("fruit_pct") or {}).get("value"))
-
-    # Scale to per 100 if we can
-    energy_kj = scale_to_100(energy_kj)
-    sugars_g = scale_to_100(sugars_g)
-    sodium_mg = scale_to_100(sodium_mg)
-    sat_fat_g = scale_to_100(sat_fat_g)
-    trans_fat_g = scale_to_100(trans_fat_g)
-    fiber_g = scale_to_100(fiber_g)
-    protein_g = scale_to_100(protein_g)
-
-    return {
-        "energy_kj": energy_kj,
-        "sugar_g": sugars_g,
-        "sodium_mg": sodium_mg,
-        "sat_fat_g": sat_fat_g,
-        "trans_fat_g": trans_fat_g,
-        "fiber_g": fiber_g,
-        "protein_g": protein_g,
-        "fruit_pct": fruit_pct,
-    }
+    # Multiplier to per 100 g/ml (unknown basis: values are kept as-is)
+    factor = 1.0
+    if basis == "per_serving" and sv and su in ("g", "ml") and sv > 0:
+        factor = 100.0 / sv
 
-def gemini_extract_label(img: Image.Image) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    parse_num, convert = _parse_num, _convert  # local lookups inside the loop
+    out: Dict[str, Optional[float]] = {}
+    for key, out_key, target in _NUTRIENT_SPECS:
+        sub = block.get(key) or _EMPTY
+        v = convert(parse_num(sub.get("value")), sub.get("unit"), target)
+        out[out_key] = v * factor if (v is not None and factor != 1.0) else v
+
+    out["fruit_pct"] = parse_num((block.get("fruit_pct") or _EMPTY).get("value"))
+    return out
+
+_JPEG_SOI = b"\xff\xd8\xff"  # start-of-image marker; anything else (PNG, HEIC, ...) is re-encoded
+
+def gemini_extract_label(img: Image.Image, no_cache: bool = False,
+                         raw_jpeg: Optional[bytes] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     """
     Returns (payload, diagnostics). payload keys:
       - name, brand, beverage, ingredients_text, nutrition (normalized)
+    Identical images are served from the local LLM cache unless no_cache=True.
+    If raw_jpeg (the original upload bytes) is given, is actually a JPEG and the image is
+    already within MAX_DIM, those bytes are sent as-is instead of re-encoding img.
     """
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         return None, {"ok": False, "reason": "NO_API_KEY"}
 
+    key = None
+    if not no_cache:
+        key = _cache_key(img, raw_jpeg)
+        cached = _CACHE.get(key)
+        if cached is not None:
+            return cached, {"ok": True, "model": USE_MODEL, "cached": True}
+
     try:
-        import google.generativeai as genai
+        model = _get_model(api_key)
     except Exception as e:
         return None, {"ok": False, "reason": f"SDK_IMPORT_FAIL: {e}"}
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(USE_MODEL)
+    if raw_jpeg is not None and raw_jpeg[:3] == _JPEG_SOI and max(img.size) <= MAX_DIM:
+        b64 = base64.b64encode(raw_jpeg).decode("ascii")
+    else:
+        b64 = _pil_to_b64_jpeg(img)
 
     parts = [
         {"text": PROMPT},
         {
             "inline_data": {
                 "mime_type": "image/jpeg",
-                "data": _pil_to_b64_jpeg(img),
+                "data": b64,
             }
         },
     ]
@@ -190,4 +221,6 @@ def gemini_extract_label(img: Image.Image) -> Tuple[Optional[Dict[str, Any]], Di
         "notes": data.get("notes"),
         "model": USE_MODEL,
     }
+    if key is not None:
+        _CACHE.set(key, result)
     return result, {"ok": True, "model": USE_MODEL}
@@ -1,9 +1,22 @@
 # core/ocr.py
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from PIL import Image, ImageOps, ImageFilter
 import pytesseract
+import hashlib
+import tempfile
+import threading
 import io
 import math
+import os
+
+try:
+    import numpy as np  # optional, vectorized thresholding (always present with cv2)
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
 
 try:
     import cv2  # optional, for better preprocessing
@@ -11,36 +24,144 @@ try:
 except Exception:
     _HAS_CV2 = False
 
+try:
+    import diskcache  # optional, persists OCR results across restarts
+    _HAS_DISKCACHE = True
+except Exception:
+    _HAS_DISKCACHE = False
+
 # Tweak this to your languages (add +de, +es, etc. if you expect them)
 LANGS = "eng"
 
+# OpenCV preprocessing: working-size cap and smallest skew (degrees) worth correcting
+DESKEW_MAX_DIM = 1600
+DESKEW_MIN_ANGLE = 0.5
+
+# Common OCR quirks in ingredient lists, fixed in one str.translate pass
+_CLEAN_TRANS = str.maketrans({
+    "•": ",",
+    ";": ",",
+    "|": "I",
+    "”": '"',
+    "“": '"',
+    "‘": "'",
+    "’": "'",
+})
+
+# Stop after the first PSM pass when it is this confident (avg conf, 0..100) and non-trivial
+EARLY_EXIT_CONF = 85.0
+EARLY_EXIT_MIN_CHARS = 20
+# Only try the plain image_to_string fallback when the best pass is below this confidence
+FALLBACK_MAX_CONF = 30.0
+
 # Characters you expect in ingredient lists
 WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789,.-()%/ +"
 
+# Cache of cleaned OCR text keyed by image hash (in-memory LRU + optional disk tier)
+OCR_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "ocr_cache"
+OCR_MEM_CACHE_SIZE = int(os.getenv("OCR_MEM_CACHE_SIZE", "256"))
+
+_mem_cache: "OrderedDict[str, str]" = OrderedDict()
+_mem_lock = threading.Lock()
+_disk_cache = None
+
+def _get_disk_cache():
+    global _disk_cache
+    if _disk_cache is None and _HAS_DISKCACHE:
+        try:
+            _disk_cache = diskcache.Cache(str(OCR_CACHE_DIR))
+        except Exception:
+            return None
+    return _disk_cache
+
+def _cache_key(img: Image.Image) -> str:
+    h = hashlib.sha256()
+    # EXIF orientation is applied later, so it is part of the input identity
+    try:
+        orientation = img.getexif().get(0x0112)
+    except Exception:
+        orientation = None
+    h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:{orientation}:{LANGS}:{WHITELIST}:".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+def _bytes_cache_key(raw: bytes) -> str:
+    h = hashlib.sha256()
+    h.update(f"raw:{LANGS}:{WHITELIST}:".encode())
+    h.update(raw)
+    return h.hexdigest()
+
+def _cache_get(key: str) -> Optional[str]:
+    with _mem_lock:
+        if key in _mem_cache:
+            _mem_cache.move_to_end(key)
+            return _mem_cache[key]
+    disk = _get_disk_cache()
+    if disk is not None:
+        try:
+            hit = disk.get(key)
+        except Exception:
+            hit = None
+        if hit is not None:
+            _mem_put(key, hit)
+            return hit
+    return None
+
+def _mem_put(key: str, text: str) -> None:
+    with _mem_lock:
+        _mem_cache[key] = text
+        _mem_cache.move_to_end(key)
+        while len(_mem_cache) > OCR_MEM_CACHE_SIZE:
+            _mem_cache.popitem(last=False)
+
+def _cache_set(key: str, text: str) -> None:
+    _mem_put(key, text)
+    disk = _get_disk_cache()
+    if disk is not None:
+        try:
+            disk.set(key, text)
+        except Exception:
+            pass
+
 def _pil_fix_orientation(img: Image.Image) -> Image.Image:
     try:
         return ImageOps.exif_transpose(img)
     except Exception:
         return img
 
+# 8-bit lookup table for the no-NumPy binarization path
+_THRESHOLD_LUT = [255 if p > 180 else 0 for p in range(256)]
+
 def _pil_preprocess(img: Image.Image) -> Image.Image:
     # Grayscale → slight sharpen → upscale if small → adaptive-ish threshold
     g = img.convert("L")
-    if min(g.size) < 900:
+    w, h = g.size
+    if min(w, h) < 900:
         # upscale small images for better OCR
-        scale = 1200.0 / min(g.size)
-        g = g.resize((int(g.width * scale), int(g.height * scale)), Image.BICUBIC)
+        scale = 1200.0 / min(w, h)
+        new_w, new_h = int(w * scale), int(h * scale)
+        g = g.resize((new_w, new_h), Image.BICUBIC)
     g = g.filter(ImageFilter.UnsharpMask(radius=1.2, percent=150, threshold=3))
 
     # Simple binarization that works reasonably without OpenCV
     # (we’ll rely on OpenCV’s adaptive threshold if available)
-    return g.point(lambda p: 255 if p > 180 else 0)
+    if _HAS_NUMPY:
+        arr = np.asarray(g, dtype=np.uint8)
+        return Image.fromarray(np.where(arr > 180, np.uint8(255), np.uint8(0)))
+    return g.point(_THRESHOLD_LUT)
+
+def _cv2_preprocess(img: "Union[Image.Image, np.ndarray]") -> Image.Image:
+    # Accepts a PIL image or an already-decoded OpenCV (BGR/gray) array
+    if isinstance(img, Image.Image):
+        arr = np.array(img.convert("RGB"))[:, :, ::-1]  # to BGR
+    else:
+        arr = img
+    gray = arr if arr.ndim == 2 else cv2.cvtColor(arr, cv2.COLOR_BGR2GRAY)
 
-def _cv2_preprocess(img: Image.Image) -> Image.Image:
-    # Convert PIL→OpenCV
-    import numpy as np
-    arr = np.array(img.convert("RGB"))[:, :, ::-1]  # to BGR
-    gray = cv2.cvtColor(arr, cv2.COLOR_BGR2GRAY)
+    # Cap the working size; deskew/threshold cost scales with pixel count
+    if max(gray.shape[:2]) > DESKEW_MAX_DIM:
+        scale = DESKEW_MAX_DIM / float(max(gray.shape[:2]))
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
 
     # Deskew (estimate angle via moments)
     coords = cv2.findNonZero(255 - gray)
@@ -50,9 +171,17 @@ def _cv2_preprocess(img: Image.Image) -> Image.Image:
             angle = -(90 + angle)
         else:
             angle = -angle
-        (h, w) = gray.shape[:2]
-        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-        gray = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        # minAreaRect only measures skew modulo 90°: fold into (-45, 45] so an upright
+        # block reported as ±90 (newer OpenCV) is not turned on its side
+        if angle > 45:
+            angle -= 90
+        elif angle <= -45:
+            angle += 90
+        # Skip the full-image warp when the label is already straight
+        if abs(angle) >= DESKEW_MIN_ANGLE:
+            (h, w) = gray.shape[:2]
+            M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+            gray = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
 
     # Adaptive threshold + light morphology
     thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -69,9 +198,19 @@ def _cv2_preprocess(img: Image.Image) -> Image.Image:
     pil = Image.fromarray(thr)
     return pil
 
-def _run_tesseract(img: Image.Image, psm: int) -> Tuple[str, float]:
+def _save_for_tesseract(img: Image.Image) -> str:
     """
-    Returns (text, avg_confidence 0..100)
+    Write the preprocessed image to a temp PNG once; pytesseract reads path inputs as-is,
+    so every PSM pass shares this file instead of re-encoding the image.
+    """
+    fd, path = tempfile.mkstemp(prefix="ocr_", suffix=".png")
+    with os.fdopen(fd, "wb") as f:
+        img.save(f, format="PNG")
+    return path
+
+def _run_tesseract(img: Union[Image.Image, str], psm: int) -> Tuple[str, float]:
+    """
+    Returns (text, avg_confidence 0..100). img may be a PIL image or an image path.
     """
     config = f'--oem 3 --psm {psm} -l {LANGS} -c tessedit_char_whitelist="{WHITELIST}"'
     data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
@@ -82,42 +221,85 @@ def _run_tesseract(img: Image.Image, psm: int) -> Tuple[str, float]:
     avg_conf = sum(confs) / max(len(confs), 1) if confs else 0.0
     return text, avg_conf
 
-def extract_text(img: Image.Image) -> str:
+def _ocr_preprocessed(proc: Image.Image) -> str:
     """
-    Best-effort OCR with preprocessing and multiple PSM tries.
+    Run the PSM passes on an already-preprocessed image and return cleaned text.
     """
-    img = _pil_fix_orientation(img)
-
-    proc = _cv2_preprocess(img) if _HAS_CV2 else _pil_preprocess(img)
-
     # Try a few PSMs commonly good for labels
     # 6: Assume a single uniform block of text
     # 11: Sparse text
     # 4: Single column of text of variable sizes
     psm_candidates: List[int] = [6, 11, 4]
 
-    best_text, best_conf = "", -1.0
-    for psm in psm_candidates:
-        t, conf = _run_tesseract(proc, psm)
-        if conf > best_conf:
-            best_conf, best_text = conf, t
+    path = _save_for_tesseract(proc)
+    try:
+        # Clean labels are usually solved by the first PSM; only run the others if needed
+        results = [_run_tesseract(path, psm_candidates[0])]
+        first_text, first_conf = results[0]
+        if not (first_conf >= EARLY_EXIT_CONF and len(first_text.strip()) >= EARLY_EXIT_MIN_CHARS):
+            # Each pass is a separate tesseract process, so threads run them in parallel
+            rest = psm_candidates[1:]
+            with ThreadPoolExecutor(max_workers=len(rest)) as ex:
+                results += list(ex.map(lambda psm: _run_tesseract(path, psm), rest))
+        # max() keeps the earliest PSM on ties, like the old sequential loop
+        best_text, best_conf = max(results, key=lambda r: r[1])
 
-    # Fallback to vanilla image_to_string if everything fails short
-    if len(best_text.strip()) < 10:
-        fallback = pytesseract.image_to_string(proc, config=f'-l {LANGS} --oem 3 --psm 6')
-        if len(fallback.strip()) > len(best_text.strip()):
-            best_text = fallback
+        # Fallback to vanilla image_to_string if everything fails short and unsure
+        if len(best_text.strip()) < 10 and best_conf < FALLBACK_MAX_CONF:
+            fallback = pytesseract.image_to_string(path, config=f'-l {LANGS} --oem 3 --psm 6')
+            if len(fallback.strip()) > len(best_text.strip()):
+                best_text = fallback
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
     # Normalize whitespace and common OCR quirks for ingredients
-    cleaned = (
-        best_text.replace("•", ",")
-                 .replace(";", ",")
-                 .replace("|", "I")
-                 .replace("”", '"')
-                 .replace("“", '"')
-                 .replace("‘", "'")
-                 .replace("’", "'")
-    )
+    cleaned = best_text.translate(_CLEAN_TRANS)
     # Collapse multiple spaces/newlines
-    cleaned = " ".join(cleaned.split())
-    return cleaned.strip()
+    return " ".join(cleaned.split()).strip()
+
+def extract_text(img: Image.Image) -> str:
+    """
+    Best-effort OCR with preprocessing and multiple PSM tries.
+    Results are cached by decoded pixels (_cache_key), so repeat images skip Tesseract entirely.
+    """
+    key = _cache_key(img)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    img = _pil_fix_orientation(img)
+    proc = _cv2_preprocess(img) if _HAS_CV2 else _pil_preprocess(img)
+
+    cleaned = _ocr_preprocessed(proc)
+    _cache_set(key, cleaned)
+    return cleaned
+
+def extract_text_from_bytes(raw: bytes) -> str:
+    """
+    Same pipeline as extract_text, but for the encoded upload (e.g. JPEG bytes).
+    With OpenCV the bytes are decoded straight to an array (EXIF orientation applied),
+    skipping the PIL decode and PIL→NumPy copy.
+    Shares the cache store with extract_text but keys on the encoded bytes (_bytes_cache_key):
+    a pixel key would need the decode this path avoids, so one image reached through both
+    entry points is cached once per entry point.
+    """
+    key = _bytes_cache_key(raw)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    proc = None
+    if _HAS_CV2:
+        arr = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+        if arr is not None:
+            proc = _cv2_preprocess(arr)
+    if proc is None:
+        img = _pil_fix_orientation(Image.open(io.BytesIO(raw)))
+        proc = _cv2_preprocess(img) if _HAS_CV2 else _pil_preprocess(img)
+
+    cleaned = _ocr_preprocessed(proc)
+    _cache_set(key, cleaned)
+    return cleaned
@@ -0,0 +1,26 @@
+# core/renderers.py
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson  # optional, C-level JSON encoder
+    _HAS_ORJSON = True
+except Exception:
+    _HAS_ORJSON = False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+    Indented output (browsable API, ?indent=) and types orjson can't encode
+    go through DRF's own encoder, so responses never fail because of the swap.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not _HAS_ORJSON or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data)
+        except TypeError:  # orjson.JSONEncodeError
+            return super().render(data, accepted_media_type, renderer_context)
@@ -1,3 +1,455 @@
+import base64
+import io
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import requests
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
-# Create your tests here.
+from core import llm_cache
+from core import utils
+from core import views
+
+
+def _off_response(url, **_kwargs):
+    """Fake OFF API: barcodes starting with 404 don't exist, everything else does."""
+    barcode = url.rsplit("/", 1)[-1].removesuffix(".json")
+    if barcode.startswith("404"):
+        body = {"status": 0, "status_verbose": "product not found"}
+        return mock.Mock(status_code=404, content=json.dumps(body).encode(), json=lambda: body)
+    body = {
+        "status": 1,
+        "product": {
+            "product_name": f"Product {barcode}",
+            "ingredients_text": "wheat flour, sugar, salt",
+            "nutriments": {"sugars_100g": 10, "salt_100g": 1.0},
+        },
+    }
+    return mock.Mock(status_code=200, content=json.dumps(body).encode(), json=lambda: body)
+
+
+class ProductsLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        utils._off_cache.clear()
+        patcher = mock.patch.object(utils._SESSION, "get", side_effect=_off_response)
+        self.session_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, barcodes):
+        return self.client.get("/api/products/", {"barcodes": barcodes},
+                               HTTP_HOST="localhost", HTTP_ACCEPT="application/json")
+
+    def requested(self):
+        return sorted(c.args[0].rsplit("/", 1)[-1] for c in self.session_get.call_args_list)
+
+    def test_keeps_order_and_drops_duplicates(self):
+        r = self.get("3017620422003, 5449000000996,40400000,3017620422003")
+        self.assertEqual(r.status_code, 200)
+        body = r.json()
+        self.assertEqual([p["barcode"] for p in body["products"]], ["3017620422003", "5449000000996"])
+        self.assertEqual(body["not_found"], ["40400000"])
+        self.assertEqual(self.requested(), ["3017620422003.json", "40400000.json", "5449000000996.json"])
+
+    def test_rejects_non_digit_barcodes_without_fetching(self):
+        r = self.get("../../../cgi/search.pl?x=,12#34,123,3017620422003")
+        self.assertEqual(r.status_code, 200)
+        body = r.json()
+        self.assertEqual([p["barcode"] for p in body["products"]], ["3017620422003"])
+        self.assertEqual(body["not_found"], ["../../../cgi/search.pl?x=", "12#34", "123"])
+        self.assertEqual(self.requested(), ["3017620422003.json"])
+
+    def test_cache_hit_skips_off(self):
+        self.get("3017620422003,40400000")
+        self.session_get.reset_mock()
+        utils._off_cache.clear()  # only the Django cache may answer now
+
+        r = self.get("3017620422003,5449000000996")
+        self.assertEqual([p["barcode"] for p in r.json()["products"]], ["3017620422003", "5449000000996"])
+        self.assertEqual(self.requested(), ["5449000000996.json"])
+
+    def test_missing_and_oversized_requests_are_rejected(self):
+        self.assertEqual(self.get("").status_code, 400)
+        self.assertEqual(self.get(" , ,").status_code, 400)
+        too_many = ",".join(str(10000 + i) for i in range(views.MAX_BATCH_BARCODES + 1))
+        self.assertEqual(self.get(too_many).status_code, 400)
+        self.session_get.assert_not_called()
+
+
+class AnalysisCacheTests(TestCase):
+    def setUp(self):
+        utils._analysis_cache.clear()
+        self.addCleanup(utils._analysis_cache.clear)
+        patcher = mock.patch.object(utils, "analyze_product", wraps=utils.analyze_product)
+        self.analyze = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def product(self, rev=1, ts=1700000000, sugar=10):
+        return {"product_name": "Bar", "ingredients_text": "oats, sugar", "rev": rev,
+                "last_modified_t": ts, "nutriments": {"sugars_100g": sugar}}
+
+    def test_hit_returns_an_independent_copy(self):
+        first = utils.analyze_product_cached(self.product(), "1")
+        first["name"] = "mutated"
+        second = utils.analyze_product_cached(self.product(), "1")
+        self.assertEqual(self.analyze.call_count, 1)
+        self.assertEqual(second["name"], "Bar")
+
+    def test_new_rev_or_timestamp_or_barcode_misses(self):
+        utils.analyze_product_cached(self.product(), "1")
+        edited = utils.analyze_product_cached(self.product(rev=2, sugar=40), "1")
+        utils.analyze_product_cached(self.product(ts=1700000001), "1")
+        utils.analyze_product_cached(self.product(), "2")
+        self.assertEqual(self.analyze.call_count, 4)
+        self.assertEqual(edited["nutrition"]["sugar_g"], 40)
+
+    def test_products_without_revision_info_are_not_cached(self):
+        p = self.product(rev=None, ts=None)
+        utils.analyze_product_cached(p, "1")
+        utils.analyze_product_cached(p, "1")
+        self.assertEqual(self.analyze.call_count, 2)
+        self.assertEqual(len(utils._analysis_cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(utils, "ANALYSIS_CACHE_SIZE", 2):
+            utils.analyze_product_cached(self.product(), "1")
+            utils.analyze_product_cached(self.product(), "2")
+            utils.analyze_product_cached(self.product(), "1")  # refresh 1; 2 is now oldest
+            utils.analyze_product_cached(self.product(), "3")
+            self.assertEqual(self.analyze.call_count, 3)
+            utils.analyze_product_cached(self.product(), "1")
+            self.assertEqual(self.analyze.call_count, 3)
+            utils.analyze_product_cached(self.product(), "2")
+            self.assertEqual(self.analyze.call_count, 4)
+            self.assertEqual(len(utils._analysis_cache), 2)
+
+
+class OffProductCacheTests(TestCase):
+    def setUp(self):
+        utils._off_cache.clear()
+        patcher = mock.patch.object(utils._SESSION, "get", side_effect=_off_response)
+        self.session_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_analysed_fields_are_kept(self):
+        big = _off_response("https://x/3017620422003.json")
+        body = big.json()
+        body["product"]["packaging_text"] = "x" * 100_000
+        body["product"]["images"] = {str(i): {"sizes": {"400": {"h": 400, "w": 300}}} for i in range(200)}
+        big.content = json.dumps(body).encode()
+        self.session_get.side_effect = lambda *_a, **_k: big
+
+        full = utils.analyze_product(body["product"], "3017620422003")
+        self.assertEqual(utils.off_lookup("3017620422003"), full)
+        cached = utils._off_cache["3017620422003"][1]
+        self.assertLessEqual(cached.keys(), set(utils._OFF_PRODUCT_FIELDS))
+        self.assertIn("nutriments", cached)
+
+    def clock(self, start=1000.0):
+        now = [start]
+        patcher = mock.patch.object(utils, "time", mock.Mock(monotonic=lambda: now[0]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return now
+
+    def fetches(self):
+        return self.session_get.call_count
+
+    def test_found_products_are_served_until_the_ttl_expires(self):
+        now = self.clock()
+        self.assertIsNotNone(utils._fetch_off_product("3017620422003"))
+        now[0] += utils.OFF_CACHE_TTL - 1
+        self.assertIsNotNone(utils._fetch_off_product("3017620422003"))
+        self.assertEqual(self.fetches(), 1)
+        now[0] += 2
+        self.assertIsNotNone(utils._fetch_off_product("3017620422003"))
+        self.assertEqual(self.fetches(), 2)
+
+    def test_missing_products_are_cached_for_the_negative_ttl(self):
+        now = self.clock()
+        self.assertIsNone(utils._fetch_off_product("40400000"))
+        self.assertIsNone(utils._fetch_off_product("40400000"))
+        self.assertEqual(self.fetches(), 1)
+        now[0] += utils.OFF_NEGATIVE_TTL + 1
+        self.assertIsNone(utils._fetch_off_product("40400000"))
+        self.assertEqual(self.fetches(), 2)
+
+    def test_transient_failures_are_not_cached(self):
+        self.session_get.side_effect = [mock.Mock(status_code=503), requests.ConnectionError("down")]
+        self.assertIsNone(utils._fetch_off_product("3017620422003"))
+        self.assertIsNone(utils._fetch_off_product("3017620422003"))
+        self.assertEqual(len(utils._off_cache), 0)
+        self.session_get.side_effect = _off_response
+        self.assertIsNotNone(utils._fetch_off_product("3017620422003"))
+        self.assertEqual(self.fetches(), 3)
+
+    def test_least_recently_used_barcode_is_evicted(self):
+        with mock.patch.object(utils, "OFF_CACHE_SIZE", 2):
+            for b in ("1000001", "1000002", "1000001", "1000003"):  # 1000002 is oldest when 1000003 lands
+                utils._fetch_off_product(b)
+            self.assertEqual(list(utils._off_cache), ["1000001", "1000003"])
+            utils._fetch_off_product("1000001")
+            self.assertEqual(self.fetches(), 3)
+
+
+class ParseIngredientsTests(TestCase):
+    def test_empty_scan_has_the_same_shape_as_a_real_one(self):
+        real = utils.parse_ingredients("Ingredients: rice, palm oil, E621")
+        for text in ("", "   \n"):
+            empty = utils.parse_ingredients(text)
+            self.assertEqual(empty.keys(), real.keys())
+            self.assertEqual(list(empty["flags"]), list(real["flags"]))
+            self.assertFalse(any(empty["flags"].values()))
+        self.assertTrue(real["flags"]["palmOil"])
+        self.assertTrue(real["flags"]["msgLikeEnhancer"])
+
+
+class CoerceNutritionTests(TestCase):
+    def test_non_finite_values_are_missing(self):
+        n = utils.coerce_nutrition({"sugars_100g": "nan", "proteins_100g": float("inf"),
+                                    "fiber_100g": "-Infinity", "salt_100g": "NaN", "energy-kcal_100g": "x"})
+        self.assertEqual(n, dict.fromkeys(n, None))
+        self.assertEqual(utils.coerce_nutrition({"sugars_100g": "12.5"})["sugar_g"], 12.5)
+
+
+class BatchScoreTests(TestCase):
+    TEXTS = ("", "sugar, palm oil, salt", "whole oats", "wheat flour, flavour enhancer (E621), colour (E102)",
+             "fried potatoes, hydrogenated vegetable oil, sweetener")
+
+    def test_batch_matches_scalar_with_missing_and_nan(self):
+        rng = random.Random(7)
+        nan = float("nan")
+        nutritions, additives, texts, beverages = [], [], [], []
+        for _ in range(400):
+            nutritions.append({k: rng.choice([None, nan, 0.0, rng.uniform(0, 60), rng.uniform(0, 3000)])
+                               for k in (*utils._SCORE_COLUMNS, "trans_fat_g")})
+            text = rng.choice(self.TEXTS)
+            additives.append(utils.parse_ingredients(text)["additives"])
+            texts.append(text)
+            beverages.append(rng.random() < 0.3)
+
+        scalar = [utils.compute_health_score(n, a, t, b)
+                  for n, a, t, b in zip(nutritions, additives, texts, beverages)]
+        self.assertEqual(utils.compute_health_scores_batch(nutritions, additives, texts, beverages), scalar)
+
+
+class OcrAnalyzeTests(TestCase):
+    def setUp(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (200, 100), "white").save(buf, "PNG")
+        self.png = buf.getvalue()
+
+    def post(self, local_extract, tesseract_text="Ingredients: sugar, palm oil, salt"):
+        upload = SimpleUploadedFile("label.png", self.png, content_type="image/png")
+        with mock.patch.object(views, "local_extract", local_extract), \
+                mock.patch.object(views.pytesseract, "image_to_string", return_value=tesseract_text) as ocr:
+            r = self.client.post("/api/ocr/analyze/", {"image": upload},
+                                 HTTP_HOST="localhost", HTTP_ACCEPT="application/json")
+        self.assertEqual(r.status_code, 200)
+        return r.json(), ocr
+
+    def test_local_pipeline_gets_the_upload_bytes(self):
+        local = mock.Mock(return_value="Ingredients: oats, sugar")
+        body, ocr = self.post(local)
+        local.assert_called_once_with(self.png)
+        ocr.assert_not_called()
+        self.assertEqual(body["ingredients_text"], "Ingredients: oats, sugar")
+        self.assertEqual(body["diagnostics"]["ocr"]["used_local_extract"], True)
+
+    def test_falls_back_to_raw_tesseract(self):
+        for local in (None, mock.Mock(return_value=""), mock.Mock(side_effect=RuntimeError("boom"))):
+            body, ocr = self.post(local)
+            ocr.assert_called_once()
+            diag = body["diagnostics"]["ocr"]
+            self.assertEqual(diag["local_extract_available"], local is not None)
+            self.assertEqual(diag["used_local_extract"], False)
+            self.assertNotIn("pytesseract_error", diag)
+            self.assertEqual(body["ingredients_text"], "Ingredients: sugar, palm oil, salt")
+            self.assertIn("Palm oil", " ".join(body["negatives"]))
+            self.assertNotIn("boom", json.dumps(body))
+
+
+class _FakeDiskCache(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+class OcrCacheTests(TestCase):
+    def setUp(self):
+        from core import ocr
+        self.ocr = ocr
+        ocr._mem_cache.clear()
+        self.addCleanup(ocr._mem_cache.clear)
+        self.disk = _FakeDiskCache()
+        patcher = mock.patch.multiple(ocr, _get_disk_cache=mock.Mock(return_value=self.disk),
+                                      _ocr_preprocessed=mock.Mock(side_effect=lambda proc: f"text {proc.size}"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def runs(self):
+        return self.ocr._ocr_preprocessed.call_count
+
+    def image(self, colour=255, size=(120, 40)):
+        return Image.new("L", size, colour)
+
+    def test_same_pixels_hit_and_different_pixels_miss(self):
+        first = self.ocr.extract_text(self.image())
+        self.assertEqual(self.ocr.extract_text(self.image()), first)
+        self.assertEqual(self.runs(), 1)
+        self.ocr.extract_text(self.image(colour=0))
+        self.ocr.extract_text(self.image(size=(40, 120)))
+        self.ocr.extract_text(self.image().convert("RGB"))
+        self.assertEqual(self.runs(), 4)
+
+    def test_key_covers_languages_and_orientation(self):
+        img = self.image()
+        key = self.ocr._cache_key(img)
+        with mock.patch.object(self.ocr, "LANGS", "eng+deu"):
+            self.assertNotEqual(self.ocr._cache_key(img), key)
+        rotated = self.image()
+        rotated.getexif()[0x0112] = 6
+        self.assertNotEqual(self.ocr._cache_key(rotated), key)
+
+    def test_bytes_entry_point_hits_on_identical_bytes(self):
+        buf = io.BytesIO()
+        self.image().save(buf, "PNG")
+        self.ocr.extract_text_from_bytes(buf.getvalue())
+        self.ocr.extract_text_from_bytes(buf.getvalue())
+        self.assertEqual(self.runs(), 1)
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        a, b, c = self.image(0), self.image(100), self.image(200)
+        with mock.patch.object(self.ocr, "OCR_MEM_CACHE_SIZE", 2):
+            for img in (a, b, a, c):  # b is oldest when c lands
+                self.ocr.extract_text(img)
+            self.assertEqual(list(self.ocr._mem_cache),
+                             [self.ocr._cache_key(a), self.ocr._cache_key(c)])
+
+    def test_disk_tier_survives_a_memory_flush(self):
+        img = self.image()
+        text = self.ocr.extract_text(img)
+        self.assertEqual(self.disk[self.ocr._cache_key(img)], text)
+        self.ocr._mem_cache.clear()  # e.g. a restarted worker
+        self.assertEqual(self.ocr.extract_text(img), text)
+        self.assertEqual(self.runs(), 1)
+        self.assertIn(self.ocr._cache_key(img), self.ocr._mem_cache)  # promoted back to memory
+
+    def test_broken_disk_tier_behaves_like_a_miss(self):
+        broken = mock.Mock(get=mock.Mock(side_effect=OSError("locked")), set=mock.Mock(side_effect=OSError("full")))
+        with mock.patch.object(self.ocr, "_get_disk_cache", return_value=broken):
+            self.assertTrue(self.ocr.extract_text(self.image()))
+            self.ocr._mem_cache.clear()
+            self.ocr.extract_text(self.image())
+        self.assertEqual(self.runs(), 2)
+
+
+class OcrPipelineTests(TestCase):
+    def test_truncated_upload_still_decodes(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (3000, 2000), "white").save(buf, "JPEG")
+        img = views._prep_for_ocr(io.BytesIO(buf.getvalue()[: len(buf.getvalue()) // 2]))
+        self.assertEqual((img.mode, max(img.size)), ("L", views.MAX_DIMENSION))
+
+    def test_timed_out_job_is_cancelled_and_reported(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        pool.submit(release.wait, 5)  # occupy the only worker so the OCR job stays queued
+        img = Image.new("L", (50, 20), 255)
+        with mock.patch.object(views, "_OCR_POOL", pool), \
+                mock.patch.object(views, "OCR_TIMEOUT", -4.9), \
+                mock.patch.object(views, "local_extract", None), \
+                mock.patch.object(views.pytesseract, "image_to_string", return_value="sugar") as ocr:
+            text, diag = views._local_ocr_pipeline(img, b"")
+            release.set()
+            pool.shutdown(wait=True)
+        self.assertEqual(text, "")
+        self.assertEqual(diag["pytesseract_error"], "timeout")
+        ocr.assert_not_called()
+
+
+class LlmNutritionTests(TestCase):
+    def test_unit_conversion_matches_plain_division(self):
+        from core import llm_ocr
+        for mg in range(0, 2001):
+            self.assertEqual(llm_ocr._convert(float(mg), "mg", "g"), mg / 1000.0)
+        self.assertEqual(llm_ocr._convert(2.5, "G", "mg"), 2500.0)
+        self.assertEqual(llm_ocr._convert(100.0, "kcal", "kj"), 100.0 * 4.184)
+        self.assertIsNone(llm_ocr._convert(1.0, "oz", "g"))
+
+    def test_only_jpeg_bytes_are_sent_unencoded(self):
+        from core import llm_ocr
+        img = Image.new("RGB", (64, 32), "white")
+        png, jpeg = io.BytesIO(), io.BytesIO()
+        img.save(png, "PNG")
+        img.save(jpeg, "JPEG")
+
+        def sent_bytes(raw):
+            model = mock.Mock()
+            model.generate_content.side_effect = RuntimeError("offline")
+            with mock.patch.dict("os.environ", {"GOOGLE_API_KEY": "test"}), \
+                    mock.patch.object(llm_ocr, "_get_model", return_value=model):
+                llm_ocr.gemini_extract_label(img, no_cache=True, raw_jpeg=raw)
+            part = model.generate_content.call_args.args[0][1]["inline_data"]
+            self.assertEqual(part["mime_type"], "image/jpeg")
+            return base64.b64decode(part["data"])
+
+        self.assertEqual(sent_bytes(jpeg.getvalue()), jpeg.getvalue())
+        reencoded = sent_bytes(png.getvalue())
+        self.assertEqual(reencoded[:3], b"\xff\xd8\xff")
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f"{tmp.name}/llm_cache.db"
+
+    def keys(self):
+        with sqlite3.connect(self.path) as conn:
+            return sorted(k for (k,) in conn.execute("SELECT key FROM llm_cache"))
+
+    def age(self, key, days):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("UPDATE llm_cache SET created_at = ? WHERE key = ?", (time.time() - days * 86400, key))
+
+    def test_expired_rows_are_deleted(self):
+        c = llm_cache.LLMCache(self.path, ttl_days=7)
+        c.set("old", {"a": 1})
+        c.set("new", {"a": 2})
+        self.age("old", 8)
+        self.assertIsNone(c.get("old"))
+        self.assertEqual(self.keys(), ["new", "old"])  # reads never delete
+
+        llm_cache.LLMCache(self.path, ttl_days=7).get("new")  # first connect sweeps
+        self.assertEqual(self.keys(), ["new"])
+
+        self.age("new", 8)
+        with mock.patch.object(llm_cache, "PRUNE_EVERY", 2):
+            c.set("a", {})
+            self.assertEqual(self.keys(), ["a", "new"])
+            c.set("b", {})  # every PRUNE_EVERY writes sweeps too
+        self.assertEqual(self.keys(), ["a", "b"])
+
+    def test_write_counter_is_thread_safe(self):
+        c = llm_cache.LLMCache(self.path, ttl_days=7)
+        with mock.patch.object(llm_cache, "PRUNE_EVERY", 50), \
+                mock.patch.object(llm_cache.LLMCache, "_prune", autospec=True) as prune:
+            threads = [threading.Thread(target=lambda i=i: [c.set(f"k{i}-{j}", {}) for j in range(25)])
+                       for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(c._writes, 200)
+        self.assertEqual(prune.call_count, 1 + 200 // 50)  # first connect + every 50th write
@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path("ping", views.ping),
+    path("products/", views.products_lookup),
     path("products/<str:barcode>/", views.product_lookup),
     path("ocr/analyze-text/", views.ocr_analyze_text),
     path("ocr/analyze/", views.ocr_analyze),
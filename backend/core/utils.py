@@ -1,11 +1,44 @@
 # backend/core/utils.py
 from __future__ import annotations
 
+import json
+import math
+import os
 import re
+import threading
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
 
+try:
+    import orjson  # optional, faster parsing of OFF product JSON
+    _HAS_ORJSON = True
+except Exception:
+    _HAS_ORJSON = False
+
+try:
+    import numpy as np  # optional, vectorizes batch scoring
+    _HAS_NUMPY = True
+except Exception:
+    np = None
+    _HAS_NUMPY = False
+
+try:
+    from numba import njit as _numba_njit  # optional, compiles the numeric scoring kernels
+    _HAS_NUMBA = True
+except Exception:
+    _HAS_NUMBA = False
+
+def _njit(fn):
+    # No fastmath: the kernels use NaN as the "missing" marker and must see it
+    return _numba_njit(cache=True)(fn) if _HAS_NUMBA else fn
+
 # =========================
 # --------- Regex ---------
 # =========================
@@ -15,20 +48,29 @@ from typing import Dict, List, Optional, Tuple, Any
 E_INS_RE = re.compile(
     r"""
     \b(?:
-        (?:E|INS)\s*[-\s]?(?P<code1>\d{3,4}[a-dA-D]?)    # E/INS-prefixed codes
+        (?:E|(?P<ins_prefix>INS))\s*[-\s]?(?P<code1>\d{3,4}[a-dA-D]?)    # E/INS-prefixed codes
         |
-        (?P<bare>1[0-9]{2}[a-dA-D])                      # bare 150a-d style only
+        (?P<bare>1[0-9]{2}[a-dA-D])                                      # bare 150a-d style only
     )\b
     """,
     re.I | re.X,
 )
 DASH_RANGE = r"[\u2010-\u2015]"  # fancy dashes → '-'
 
+# Hot patterns, compiled once at import instead of on every call
+_DASH_RE = re.compile(DASH_RANGE)
+_WS_RE = re.compile(r"\s+")
+_SPLIT_CHARS_RE = re.compile(r"[(),]")
+_PCT_RE = re.compile(r"(?i)\b(\d{1,3}(?:\.\d+)?)\s*%")
+_PCT_PAREN_RE = re.compile(r"\((\d{1,3}(?:\.\d+)?)\s*%\)")
+_ALLERGEN_HEAD_RE = re.compile(r"(?i)allerg(?:en|y)[^:]*:\s*([^.\n]+)")
+_ALLERGEN_SPLIT_RE = re.compile(r"[,\s;/]+")
+
 # =========================
 # ----- Static Data -------
 # =========================
 
-ALLERGENS = {
+ALLERGENS = frozenset({
     "milk", "lactose", "butter", "ghee",
     "soy", "soya",
     "wheat", "gluten", "barley", "rye", "oats",
@@ -43,19 +85,68 @@ ALLERGENS = {
     "celery",
     "lupin",
     "sulfite", "sulphite", "sulphites", "sulfites",
-}
+})
 
-BEVERAGE_HINTS = {
+BEVERAGE_HINTS = frozenset({
     "soft drink", "juice", "nectar", "soda", "cola", "tonic", "energy drink",
     "iced tea", "drink", "beverage", "water", "sparkling", "isotonic",
     "milk drink", "flavoured milk", "yogurt drink", "lassi", "buttermilk"
-}
+})
 
-NON_BEVERAGE_LIQUIDS = (
+NON_BEVERAGE_LIQUIDS = frozenset({
     "oil", "ghee", "sauce", "ketchup", "vinegar", "dressing",
     "soy sauce", "syrup", "chutney", "pickle", "rel\ufeffish"
+})
+
+ADDED_SUGAR_WORDS = (
+    "sugar", "glucose", "fructose", "hfcs", "corn syrup", "invert syrup", "malt syrup", "dextrose",
 )
 
+ARTIFICIAL_SWEETENERS = (
+    "acesulfame", "sucralose", "aspartame", "saccharin", "cyclamate", "neotame", "advantame",
+)
+
+def _alternation(words) -> str:
+    return "|".join(re.escape(w) for w in sorted(words, key=lambda w: (-len(w), w)))
+
+def _substring_re(words) -> re.Pattern:
+    # One alternation == any(w in text for w in words), but the text is scanned once
+    return re.compile(_alternation(words))
+
+_BEVERAGE_HINT_RE = _substring_re(BEVERAGE_HINTS)
+_NON_BEVERAGE_RE = _substring_re(NON_BEVERAGE_LIQUIDS)
+
+# Keyword flags over lowercased ingredients text, as (tag, pattern).
+# No two tags can match at the same offset (palm_strict is tried before palm and implies it),
+# so one zero-width alternation finds every tag in a single sweep.
+_FLAG_PATTERNS = (
+    ("palm_strict", r"\bpalm(?: oil|olein)\b"),
+    ("palm", r"\bpalm\b"),
+    ("hydrogenated", r"hydrogenated"),
+    ("salt", r"salt|sodium chloride"),
+    ("added_sugar", _alternation(ADDED_SUGAR_WORDS)),
+    ("sweetener", _alternation(ARTIFICIAL_SWEETENERS)),
+    ("art_flavour", r"\b(?:artificial|nature[-\s]*identical)\s+flavou?r"),
+    ("art_colour", r"\b(?:artificial|synthetic)\s+colou?r\b|caramel colou?r"),
+    ("fried", r"\b(?:deep[-\s]?)?fried\b"),
+    ("extruded", r"\b(?:extruded|puffed)\b"),
+    ("msg", r"\b(?:msg|monosodium glutamate)\b"),
+    ("enhancer", r"\b(?:flavou?r\s*enhancer|enhanced with|taste enhancer)\b"),
+)
+_FLAG_SCAN_RE = re.compile(
+    "(?=" + "|".join(f"(?P<{tag}>{pat})" for tag, pat in _FLAG_PATTERNS) + ")"
+)
+
+@lru_cache(maxsize=2048)
+def _scan_flags(text_lc: str) -> frozenset:
+    """Set of _FLAG_PATTERNS tags present in already-lowercased text."""
+    tags = {m.lastgroup for m in _FLAG_SCAN_RE.finditer(text_lc)}
+    if "palm_strict" in tags:
+        tags.add("palm")
+    if "fried" in tags or "extruded" in tags:
+        tags.add("fried_or_extruded")
+    return frozenset(tags)
+
 # Expanded additive knowledge (selected high-signal codes)
 ADDITIVE_DB: Dict[str, Dict[str, str]] = {
     # Flavour enhancers (MSG-like)
@@ -115,6 +206,38 @@ ADDITIVE_DB: Dict[str, Dict[str, str]] = {
 
 # Codes that behave like MSG
 MSG_LIKE = {"621", "622", "623", "624", "625", "627", "631"}
+_MSG_LIKE_BARE = frozenset(MSG_LIKE)
+_SYNTH_COLOURS = frozenset({"E102", "E104", "E110", "E122", "E124", "E129"})
+_NITRATES = frozenset({"E249", "E250", "E251", "E252"})
+_BHX = frozenset({"E319", "E320", "E321"})  # TBHQ/BHA/BHT
+
+def _bare_code(code: str) -> str:
+    return code.replace("INS", "").replace("E", "")
+
+def _index_by_bare_code(db: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    # Some codes are listed under both spellings (E150D and INS150D); they collapse onto one
+    # bare key, so refuse to load if they disagree rather than letting dict order pick a winner.
+    out: Dict[str, Dict[str, str]] = {}
+    for code, info in db.items():
+        prev = out.setdefault(_bare_code(code), info)
+        if prev != info:
+            raise ValueError(f"ADDITIVE_DB: {code} disagrees with another spelling of the same code")
+    return out
+
+# ADDITIVE_DB keyed by bare number ("150D"), so every spelling ("E150D", "INS150D", "150D")
+# resolves with a single lookup.
+_ADDITIVE_BY_BARE = _index_by_bare_code(ADDITIVE_DB)
+
+_UNKNOWN_ADDITIVE = {"name": "Unknown additive", "risk": "unknown"}
+
+# "contains ..." clauses and a single alternation of every allergen (lowercased text).
+# Longest names first so "peanuts" wins over "peanut" and "tree nuts" stays whole.
+_CONTAINS_CLAUSE_RE = re.compile(r"\bcontains\b([^.\n]*)")
+_ALLERGEN_ALT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(a) for a in sorted(ALLERGENS, key=lambda a: (-len(a), a))) + r")s?\b"
+)
+# Plural entries whose singular is also listed ("peanuts" → "peanut"); both are reported
+_ALLERGEN_SINGULAR = {a: a[:-1] for a in ALLERGENS if a.endswith("s") and a[:-1] in ALLERGENS}
 
 # =========================
 # ---- Text Utilities -----
@@ -124,44 +247,54 @@ def norm(s: str) -> str:
     if not s:
         return ""
     s = s.replace("\n", " ")
-    s = re.sub(DASH_RANGE, "-", s)
-    s = re.sub(r"\s+", " ", s)
+    s = _DASH_RE.sub("-", s)
+    s = _WS_RE.sub(" ", s)
     return s.strip()
 
 
+@lru_cache(maxsize=32)
+def _section_patterns(start_keys: Tuple[str, ...], end_keys: Tuple[str, ...]) -> Tuple[re.Pattern, List[re.Pattern]]:
+    start_re = re.compile(r"(?i)" + r"|".join([re.escape(k).replace(r"\ ", r"\s*") for k in start_keys]))
+    end_res = [re.compile(r"(?i)" + re.escape(k).replace(r"\ ", r"\s*")) for k in end_keys]
+    return start_re, end_res
+
+
 def find_section(text: str, start_keys: List[str], end_keys: List[str]) -> str:
     t = norm(text)
     if not t:
         return ""
-    start_re = re.compile(r"(?i)" + r"|".join([re.escape(k).replace(r"\ ", r"\s*") for k in start_keys]))
+    start_re, end_res = _section_patterns(tuple(start_keys), tuple(end_keys))
     m = start_re.search(t)
     if not m:
         return ""
     start = m.end()
     end = len(t)
-    for k in end_keys:
-        mm = re.search(r"(?i)" + re.escape(k).replace(r"\ ", r"\s*"), t[start:])
+    for end_re in end_res:
+        mm = end_re.search(t, start)
         if mm:
-            end = start + mm.start()
+            end = mm.start()
             break
     return t[start:end].strip(" :.-")
 
 
 def split_top_level_commas(s: str) -> List[str]:
-    parts, buf, depth = [], [], 0
-    for ch in s:
+    if "(" not in s:
+        # No nesting possible (a stray ')' never lowers depth below 0): plain C-level split
+        return [p for p in (x.strip() for x in s.split(",")) if p]
+    # Only visit parens/commas (found by the regex engine) and slice between top-level cuts
+    parts, start, depth = [], 0, 0
+    for m in _SPLIT_CHARS_RE.finditer(s):
+        ch = m.group()
         if ch == "(":
             depth += 1
         elif ch == ")":
             depth = max(0, depth - 1)
-        if ch == "," and depth == 0:
-            part = "".join(buf).strip()
+        elif depth == 0:
+            part = s[start:m.start()].strip()
             if part:
                 parts.append(part)
-            buf = []
-        else:
-            buf.append(ch)
-    last = "".join(buf).strip()
+            start = m.end()
+    last = s[start:].strip()
     if last:
         parts.append(last)
     return parts
@@ -170,62 +303,79 @@ def split_top_level_commas(s: str) -> List[str]:
 # ---- Additive Logic -----
 # =========================
 
-def _canon_additive(code: str) -> str:
-    c = code.strip().upper().replace(" ", "")
-    if c.startswith("E") or c.startswith("INS"):
-        return c
-    return f"E{c}"
-
 def extract_additives(text: str) -> List[str]:
     """
     Extract additive codes from a *targeted* text (ideally just the ingredients block).
     Avoid scanning whole labels to reduce false positives from dates/weights.
+    A code written with an INS prefix anywhere in the text is reported as INS<code>.
     """
-    if not text:
+    if not text or text.isspace():
         return []
-    raw: List[str] = []
+    return list(_extract_additives_cached(text))
+
+@lru_cache(maxsize=2048)
+def _extract_additives_cached(text: str) -> Tuple[str, ...]:
+    # bare code → seen with an INS prefix anywhere; insertion order = first appearance
+    seen: Dict[str, bool] = {}
     for m in E_INS_RE.finditer(text):
-        c = m.group("code1") or m.group("bare")
-        if not c:
-            continue
-        raw.append(c)
+        c = (m.group("code1") or m.group("bare")).upper()
+        seen[c] = seen.get(c, False) or m.group("ins_prefix") is not None
+    return tuple(f"INS{c}" if ins else f"E{c}" for c, ins in seen.items())
 
-    out = []
-    for c in raw:
-        canon = _canon_additive(c)
-        if re.search(rf"\bINS\s*[-\s]?{re.escape(c)}\b", text, flags=re.I):
-            out.append(f"INS{c.upper()}")
-        else:
-            out.append(canon)
-    seen, res = set(), []
-    for c in out:
-        cc = c.upper()
-        if cc not in seen:
-            seen.add(cc)
-            res.append(cc)
-    return res
+@lru_cache(maxsize=1024)
+def _classify_code(code: str) -> Tuple[str, str, str]:
+    key = code.upper().replace(" ", "")
+    info = _ADDITIVE_BY_BARE.get(_bare_code(key), _UNKNOWN_ADDITIVE)
+    return key, info["name"], info["risk"]
 
 def classify_additives(codes: List[str]) -> List[Dict[str, str]]:
+    # Lookups are memoized per code; the dicts are built fresh so callers may mutate them
     out = []
     for code in codes:
-        key = code.upper().replace(" ", "")
-        db_hit = (
-            ADDITIVE_DB.get(key)
-            or ADDITIVE_DB.get(key.replace("INS", "E"))
-            or ADDITIVE_DB.get(key.replace("E", "INS"))
-        )
-        if not db_hit:
-            bare = key.replace("INS", "").replace("E", "")
-            db_hit = ADDITIVE_DB.get(f"E{bare}") or ADDITIVE_DB.get(f"INS{bare}")
-        info = db_hit or {"name": "Unknown additive", "risk": "unknown"}
-        out.append({"code": key, "name": info["name"], "risk": info["risk"]})
+        key, name, risk = _classify_code(code)
+        out.append({"code": key, "name": name, "risk": risk})
     return out
 
 # =========================
 # ---- Ingredient Parse ----
 # =========================
 
+PARSE_CACHE_SIZE = 4096
+
+# Response flag → _scan_flags tag; the single source of the flag names and their order
+_INGREDIENT_FLAG_TAGS = {
+    "palmOil": "palm",
+    "addedSugar": "added_sugar",
+    "addedSalt": "salt",
+    "msgLikeEnhancer": "msg",
+    "artificialFlavour": "art_flavour",
+    "artificialColour": "art_colour",
+    "fried": "fried",
+    "extruded": "extruded",
+}
+
 def parse_ingredients(full_text: str) -> Dict[str, Any]:
+    """
+    Parse a label/ingredients text into items, allergens, additives and flags.
+    Memoized on the text; every call gets a fresh (mutable) copy of the result.
+    """
+    if not full_text or full_text.isspace():
+        # Empty OCR result: nothing to parse, skip the cache round-trip
+        return {
+            "ingredients": [],
+            "allergens": [],
+            "additives": [],
+            "flags": dict.fromkeys(_INGREDIENT_FLAG_TAGS, False),
+            "ingredients_block": "",
+        }
+    return json.loads(_parse_ingredients_cached(full_text))
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_ingredients_cached(full_text: str) -> str:
+    # Stored as JSON so cached results can't be mutated through a returned dict
+    return json.dumps(_parse_ingredients_impl(full_text))
+
+def _parse_ingredients_impl(full_text: str) -> Dict[str, Any]:
     ingredients_block = find_section(
         full_text,
         start_keys=["ingredients", "ingredient", "ingedients", "ingr edients", "in gredients", "contains"],
@@ -236,25 +386,29 @@ def parse_ingredients(full_text: str) -> Dict[str, Any]:
     if ingredients_block:
         for tok in split_top_level_commas(ingredients_block):
             tok = tok.strip(" .;")
-            m = re.search(r"(?i)\b(\d{1,3}(?:\.\d+)?)\s*%", tok)
-            pct = float(m.group(1)) if m else None
-            name = re.sub(r"\((\d{1,3}(?:\.\d+)?)\s*%\)", "", tok)
-            name = re.sub(r"\s+", " ", name).strip(" ()")
+            if "%" in tok:
+                m = _PCT_RE.search(tok)
+                pct = float(m.group(1)) if m else None
+                name = _PCT_PAREN_RE.sub("", tok)
+            else:
+                # Most items carry no percentage: skip both percent regexes
+                pct, name = None, tok
+            name = _WS_RE.sub(" ", name).strip(" ()")
             if name:
                 items.append({"name": name, "percent": pct})
 
     low = full_text.lower()
     allergens = set()
-    m_all = re.search(r"(?i)allerg(?:en|y)[^:]*:\s*([^.\n]+)", full_text)
+    m_all = _ALLERGEN_HEAD_RE.search(full_text)
     if m_all:
-        chunk = m_all.group(1).lower()
-        for w in re.split(r"[,\s;/]+", chunk):
-            ww = w.strip().rstrip(".")
-            if ww in ALLERGENS:
-                allergens.add(ww)
-    for a in ALLERGENS:
-        if re.search(rf"\bcontains\b[^.\n]*\b{re.escape(a)}s?\b", low):
+        # The chunk stops at the first '.', and the split eats whitespace: tokens are already clean
+        allergens.update(ALLERGENS.intersection(_ALLERGEN_SPLIT_RE.split(m_all.group(1).lower())))
+    for clause in _CONTAINS_CLAUSE_RE.finditer(low):
+        for m in _ALLERGEN_ALT_RE.finditer(low, clause.start(1), clause.end(1)):
+            a = m.group(1)
             allergens.add(a)
+            if a in _ALLERGEN_SINGULAR and m.group(0) == a:
+                allergens.add(_ALLERGEN_SINGULAR[a])
 
     # Normalize milk synonyms to 'milk'
     if {"lactose", "butter", "ghee"} & allergens:
@@ -264,16 +418,10 @@ def parse_ingredients(full_text: str) -> Dict[str, Any]:
     codes = extract_additives(ingredients_block or "")
     additives = classify_additives(codes)
 
-    flags = {
-        "palmOil": bool(re.search(r"\bpalm(olein| oil)?\b", low)),
-        "addedSugar": any(w in low for w in ["sugar", "glucose", "fructose", "corn syrup", "hfcs", "invert syrup", "dextrose", "malt syrup"]),
-        "addedSalt": "salt" in low or "sodium chloride" in low,
-        "msgLikeEnhancer": bool(re.search(r"\b(msg|monosodium glutamate)\b", low)) or any(k.replace("INS","").replace("E","")[:3] in MSG_LIKE for k in codes),
-        "artificialFlavour": bool(re.search(r"\b(artificial|nature[-\s]*identical)\s+flavo(u)?r", low)),
-        "artificialColour": bool(re.search(r"\b(artificial|synthetic)\s+colou?r\b|caramel colou?r", low)),
-        "fried": bool(re.search(r"\b(fried|deep[-\s]?fried|fried snack)\b", low)),
-        "extruded": bool(re.search(r"\b(extruded|puffed)\b", low)),
-    }
+    tags = _scan_flags(low)
+    flags = {name: tag in tags for name, tag in _INGREDIENT_FLAG_TAGS.items()}
+    if not flags["msgLikeEnhancer"]:
+        flags["msgLikeEnhancer"] = any(_bare_code(k)[:3] in _MSG_LIKE_BARE for k in codes)
 
     return {
         "ingredients": items,
@@ -287,47 +435,60 @@ def parse_ingredients(full_text: str) -> Dict[str, Any]:
 # ---- Nutrition Utils ----
 # =========================
 
+G_TO_MG = 1000.0
+SALT_G_TO_SODIUM_MG = 393.0  # 1 g salt ≈ 393 mg sodium
+KCAL_TO_KJ = 4.184
+
 def _to_float(x: Any) -> Optional[float]:
+    # NaN/inf (OFF does emit "nan") become None: missing is spelled one way from here on,
+    # and the scoring kernels' NaN sentinel can't collide with real data
     try:
-        return float(x)
+        v = float(x)
     except (TypeError, ValueError):
         return None
+    return v if math.isfinite(v) else None
+
+def _first(nutr: Dict[str, Any], *keys: str) -> Any:
+    """First value among keys that is present and not None."""
+    for k in keys:
+        v = nutr.get(k)
+        if v is not None:
+            return v
+    return None
+
+# Sodium sources in priority order, with the factor to mg/100g
+_SODIUM_SOURCES = (
+    ("sodium_100g", G_TO_MG),
+    ("sodium_mg_100g", 1.0),
+    ("salt_100g", SALT_G_TO_SODIUM_MG),
+)
 
 def coerce_nutrition(nutr: Dict[str, Any]) -> Dict[str, Optional[float]]:
-    # Sodium (mg/100g) with salt fallback
+    # Sodium (mg/100g) with salt fallback; the first key present wins even if it won't parse
     sodium_mg: Optional[float] = None
-    if nutr.get("sodium_100g") is not None:
-        sodium_mg = _to_float(nutr.get("sodium_100g")) * 1000.0
-    elif nutr.get("sodium_mg_100g") is not None:
-        sodium_mg = _to_float(nutr.get("sodium_mg_100g"))
-    elif nutr.get("salt_100g") is not None:
-        salt = _to_float(nutr.get("salt_100g"))
-        sodium_mg = salt * 393.0 if salt is not None else None  # 1 g salt ≈ 393 mg sodium
+    for key, factor in _SODIUM_SOURCES:
+        raw = nutr.get(key)
+        if raw is not None:
+            v = _to_float(raw)  # non-numeric strings → None instead of a TypeError
+            sodium_mg = v * factor if v is not None else None
+            break
 
     # Energy (kJ/100g) with kcal fallback (×4.184)
-    energy_kj = (nutr.get("energy-kj_100g")
-                 or nutr.get("energy_kj_100g")
-                 or nutr.get("energy_100g"))  # energy_100g is often kJ on OFF
-    if energy_kj is None and nutr.get("energy-kcal_100g") is not None:
+    raw_energy = (nutr.get("energy-kj_100g")
+                  or nutr.get("energy_kj_100g")
+                  or nutr.get("energy_100g"))  # energy_100g is often kJ on OFF
+    if raw_energy is not None:
+        energy_kj = _to_float(raw_energy)
+    else:
         kcal = _to_float(nutr.get("energy-kcal_100g"))
-        energy_kj = kcal * 4.184 if kcal is not None else None
-
-    # Saturated fat
-    sat_fat = nutr.get("saturated-fat_100g")
-    if sat_fat is None:
-        sat_fat = nutr.get("saturated_fat_100g")
-
-    # Trans fat
-    trans_fat = nutr.get("trans-fat_100g")
-    if trans_fat is None:
-        trans_fat = nutr.get("trans_fat_100g")
+        energy_kj = kcal * KCAL_TO_KJ if kcal is not None else None
 
     return {
-        "energy_kj": _to_float(energy_kj),
+        "energy_kj": energy_kj,
         "sugar_g": _to_float(nutr.get("sugars_100g")),
-        "sodium_mg": _to_float(sodium_mg),
-        "sat_fat_g": _to_float(sat_fat),
-        "trans_fat_g": _to_float(trans_fat),
+        "sodium_mg": sodium_mg,
+        "sat_fat_g": _to_float(_first(nutr, "saturated-fat_100g", "saturated_fat_100g")),
+        "trans_fat_g": _to_float(_first(nutr, "trans-fat_100g", "trans_fat_100g")),
         "fiber_g": _to_float(nutr.get("fiber_100g")),
         "protein_g": _to_float(nutr.get("proteins_100g")),
         "fruit_pct": _to_float(
@@ -338,16 +499,16 @@ def coerce_nutrition(nutr: Dict[str, Any]) -> Dict[str, Optional[float]]:
 
 def is_beverage(p: Dict[str, Any]) -> bool:
     name = (p.get("product_name") or "").lower()
-    cats = " ".join((p.get("categories") or "").lower().split(","))
+    cats = (p.get("categories") or "").lower().replace(",", " ")
     # obvious hints
     for blob in (name, cats):
-        if any(h in blob for h in BEVERAGE_HINTS):
+        if _BEVERAGE_HINT_RE.search(blob):
             return True
-        if any(nb in blob for nb in NON_BEVERAGE_LIQUIDS):
+        if _NON_BEVERAGE_RE.search(blob):
             return False
     # quantity heuristic (avoid oils/sauces)
     qty = (p.get("quantity") or "").lower()
-    if ("ml" in qty or "l" in qty) and not any(w in name for w in NON_BEVERAGE_LIQUIDS):
+    if "l" in qty and not _NON_BEVERAGE_RE.search(name):  # also covers "ml"/"cl"
         return True
     return False
 
@@ -387,34 +548,41 @@ def traffic_light_satfat(value_g_per_100: Optional[float], _beverage: bool) -> s
 # ---- Scoring (0–100) ----
 # =========================
 
-def _negative_points(energy_kj: Optional[float], sugar_g: Optional[float],
-                     sat_fat_g: Optional[float], sodium_mg: Optional[float],
+def _nan_if_none(x: Optional[float]) -> float:
+    # Always a float, so the jitted kernels only ever see one signature
+    return math.nan if x is None else float(x)
+
+@_njit
+def _negative_points(energy_kj: float, sugar_g: float,
+                     sat_fat_g: float, sodium_mg: float,
                      beverage: bool) -> float:
     """
     Higher = worse. Tuned but bounded so it can't overwhelm everything.
+    Missing values are passed as NaN (see _nan_if_none).
     """
     pts = 0.0
-    if energy_kj is not None:
+    if not math.isnan(energy_kj):
         # Map ~0–1880 kJ (0–450 kcal) to ~0–10
         pts += min(10.0, max(0.0, energy_kj / 188.0))
-    if sugar_g is not None:
+    if not math.isnan(sugar_g):
         if beverage:
             pts += min(10.0, sugar_g / 1.8)    # ~18 g → ~10
         else:
             pts += min(10.0, sugar_g / 2.8)    # ~28 g → ~10
-    if sat_fat_g is not None:
+    if not math.isnan(sat_fat_g):
         pts += min(10.0, sat_fat_g / 1.3)      # ~13 g → ~10
-    if sodium_mg is not None:
+    if not math.isnan(sodium_mg):
         pts += min(10.0, sodium_mg / 230.0)    # ~2300 mg → ~10
     return min(30.0, pts)  # absolute cap
 
-def _positive_points(fiber_g: Optional[float], protein_g: Optional[float], fruit_pct: Optional[float]) -> float:
+@_njit
+def _positive_points(fiber_g: float, protein_g: float, fruit_pct: float) -> float:
     pts = 0.0
-    if fiber_g is not None:
+    if not math.isnan(fiber_g):
         pts += min(6.0, fiber_g / 1.2)
-    if protein_g is not None:
+    if not math.isnan(protein_g):
         pts += min(5.0, protein_g / 2.2)
-    if fruit_pct is not None:
+    if not math.isnan(fruit_pct):
         if fruit_pct >= 80: pts += 5
         elif fruit_pct >= 60: pts += 4
         elif fruit_pct >= 40: pts += 3
@@ -422,6 +590,11 @@ def _positive_points(fiber_g: Optional[float], protein_g: Optional[float], fruit
         elif fruit_pct >= 5:  pts += 1
     return min(16.0, pts)
 
+if _HAS_NUMBA:
+    # Compile (or load from numba's on-disk cache) at import, not on the first request
+    _negative_points(math.nan, math.nan, math.nan, math.nan, False)
+    _positive_points(math.nan, math.nan, math.nan)
+
 def _additive_penalties(additives: List[Dict[str, str]]) -> float:
     """
     Accumulate penalties from additives; harsher on avoid/synthetic colours/nitrites/antioxidants.
@@ -445,69 +618,69 @@ def _additive_penalties(additives: List[Dict[str, str]]) -> float:
             penalty += 1
 
         # MSG-like bump
-        bare = code.replace("INS", "").replace("E", "")
-        if bare[:3] in MSG_LIKE:
+        if _bare_code(code)[:3] in _MSG_LIKE_BARE:
             penalty += 2
 
         # specific harsher codes
-        if code in {"E102","E104","E110","E122","E124","E129"}:
+        if code in _SYNTH_COLOURS:
             penalty += 5
-        if code in {"E249","E250","E251","E252"}:  # nitrites/nitrates
+        if code in _NITRATES:  # nitrites/nitrates
             penalty += 10
-        if code in {"E319","E320","E321"}:  # TBHQ/BHA/BHT
+        if code in _BHX:
             penalty += 8
 
     return min(penalty, 36.0)
 
-def _processing_penalty(text: str, flags: Dict[str, bool]) -> float:
+def _processing_penalty(tags: frozenset) -> float:
     """
-    Penalize fried/extruded, palm oil, and flavour enhancer mentions.
+    Penalize fried/extruded, palm oil, and flavour enhancer mentions (tags from _scan_flags).
     Softer and capped so it doesn't dominate.
     """
-    t = (text or "").lower()
     p = 0.0
-    if flags.get("fried"):
+    if "fried" in tags:
         p += 5
-    if flags.get("extruded"):
+    if "extruded" in tags:
         p += 4
-    if flags.get("palmOil"):
+    if "palm" in tags:
         p += 4
-    if re.search(r"\b(flavo(u)?r\s*enhancer|enhanced with|taste enhancer)\b", t):
+    if "enhancer" in tags:
         p += 2
     return min(12.0, p)
 
-def _keyword_penalties(ingredients_text: str) -> List[Tuple[str, int]]:
-    penalties: List[Tuple[str, int]] = []
-    text = (ingredients_text or "").lower()
-
-    if re.search(r"\bpalm(olein| oil)?\b", text):
-        penalties.append(("Palm oil", -6))
-    if "hydrogenated" in text or "partially hydrogenated" in text:
-        penalties.append(("Hydrogenated/partially hydrogenated oils", -20))
-    if any(word in text for word in ["sugar", "glucose", "fructose", "hfcs", "corn syrup", "invert syrup", "malt syrup", "dextrose"]):
-        penalties.append(("Added sugars/syrups", -8))
-    if "salt" in text or "sodium chloride" in text:
-        penalties.append(("Added salt", -4))
-    if any(word in text for word in ["acesulfame", "sucralose", "aspartame", "saccharin", "cyclamate", "neotame", "advantame"]):
-        penalties.append(("Artificial sweeteners", -5))
-    if re.search(r"\b(artificial|nature[-\s]*identical)\s+flavo(u)?r", text):
-        penalties.append(("Artificial flavour", -5))
-    if re.search(r"\b(artificial|synthetic)\s+colou?r\b|caramel colou?r", text):
-        penalties.append(("Added colours", -5))
-    if re.search(r"\b(fried|deep[-\s]?fried|extruded|puffed)\b", text):
-        penalties.append(("Fried/extruded processing", -6))
-    if re.search(r"\b(msg|monosodium glutamate)\b", text):
-        penalties.append(("MSG", -6))
-
-    return penalties
+# (_scan_flags tag, label, penalty) in reporting order
+_KEYWORD_PENALTIES: Tuple[Tuple[str, str, int], ...] = (
+    ("palm", "Palm oil", -6),
+    ("hydrogenated", "Hydrogenated/partially hydrogenated oils", -20),
+    ("added_sugar", "Added sugars/syrups", -8),
+    ("salt", "Added salt", -4),
+    ("sweetener", "Artificial sweeteners", -5),
+    ("art_flavour", "Artificial flavour", -5),
+    ("art_colour", "Added colours", -5),
+    ("fried_or_extruded", "Fried/extruded processing", -6),
+    ("msg", "MSG", -6),
+)
+
+def _penalties_for_tags(tags: frozenset) -> List[Tuple[str, int]]:
+    return [(label, pen) for tag, label, pen in _KEYWORD_PENALTIES if tag in tags]
+
+def keyword_penalties(ingredients_text: str, text_lc: Optional[str] = None) -> List[Tuple[str, int]]:
+    raw = ingredients_text if text_lc is None else text_lc
+    if not raw or raw.isspace():
+        return []
+    if text_lc is None:
+        text_lc = ingredients_text.lower()
+    return _penalties_for_tags(_scan_flags(text_lc))
 
 def compute_health_score(nutrition: Dict[str, Optional[float]],
                          additives: List[Dict[str, str]],
                          ingredients_text: str,
-                         beverage: bool) -> int:
+                         beverage: bool,
+                         ingredients_text_lc: Optional[str] = None,
+                         kw_penalties: Optional[List[Tuple[str, int]]] = None) -> int:
     """
     Final 0–100 score (higher is better). Balanced so typical foods land 35–85,
     junky snacks <40, minimally processed >70 when warranted.
+    Pass ingredients_text_lc / kw_penalties when the caller already has them.
     """
     energy_kj = nutrition.get("energy_kj")
     sugar_g = nutrition.get("sugar_g")
@@ -516,25 +689,41 @@ def compute_health_score(nutrition: Dict[str, Optional[float]],
     fiber_g = nutrition.get("fiber_g")
     protein_g = nutrition.get("protein_g")
     fruit_pct = nutrition.get("fruit_pct")
+    # NaN counts as missing, as in the kernels and the batch path (x == x is False only for NaN)
+    known_count = sum(x is not None and x == x for x in (energy_kj, sugar_g, sat_fat_g, sodium_mg, fiber_g, protein_g))
 
-    neg = _negative_points(energy_kj, sugar_g, sat_fat_g, sodium_mg, beverage)
-    pos = _positive_points(fiber_g, protein_g, fruit_pct)
+    neg = _negative_points(_nan_if_none(energy_kj), _nan_if_none(sugar_g),
+                           _nan_if_none(sat_fat_g), _nan_if_none(sodium_mg), bool(beverage))
+    pos = _positive_points(_nan_if_none(fiber_g), _nan_if_none(protein_g), _nan_if_none(fruit_pct))
 
     # Base + scaling
     s = 78.0 - (neg * 2.0) + (pos * 1.8)
-
+    return _finish_score(s, known_count, nutrition, additives, ingredients_text, ingredients_text_lc, kw_penalties)
+
+def _finish_score(s: float, known_count: int,
+                  nutrition: Dict[str, Optional[float]],
+                  additives: List[Dict[str, str]],
+                  ingredients_text: str,
+                  ingredients_text_lc: Optional[str],
+                  kw_penalties: Optional[List[Tuple[str, int]]] = None) -> int:
+    """Penalties, hard caps and guardrails on top of the nutrition base score."""
     # Additive + processing penalties (with caps)
     add_pen = _additive_penalties(additives or [])
-    proc_pen = _processing_penalty(ingredients_text, {
-        "palmOil": bool(re.search(r"\bpalm(olein| oil)?\b", (ingredients_text or "").lower())),
-        "fried": bool(re.search(r"\b(fried|deep[-\s]?fried|fried snack)\b", (ingredients_text or "").lower())),
-        "extruded": bool(re.search(r"\b(extruded|puffed)\b", (ingredients_text or "").lower())),
-    })
     s -= min(28.0, add_pen)   # slightly softer than before
-    s -= min(10.0, proc_pen)
+
+    # Everything below only lowers s, and sparse data is floored at 35 at the end:
+    # once a sparse score is already there, the text scans can't change the result.
+    if known_count <= 1 and s <= 35:
+        return 35
+
+    t = ingredients_text_lc if ingredients_text_lc is not None else (ingredients_text or "").lower()
+    tags = _scan_flags(t)
+    s -= min(10.0, _processing_penalty(tags))
 
     # Keyword penalties (already small, negative numbers)
-    for _label, pen in _keyword_penalties(ingredients_text):
+    if kw_penalties is None:
+        kw_penalties = _penalties_for_tags(tags)
+    for _label, pen in kw_penalties:
         s += pen
 
     # Trans fat explicit with threshold to avoid label noise
@@ -542,34 +731,75 @@ def compute_health_score(nutrition: Dict[str, Optional[float]],
         s -= 18
 
     # ---- Hard caps for red flags (kept, but balanced) ----
-    t = (ingredients_text or "").lower()
     additive_codes = { (a.get("code") or "").upper() for a in (additives or []) }
 
     if any((a.get("risk") or "").lower() == "avoid" for a in (additives or [])):
         s = min(s, 50)  # max C for "avoid" additives
-    if any(c in additive_codes for c in {"E249","E250","E251","E252"}):
+    if additive_codes & _NITRATES:
         s = min(s, 40)  # processed meat nitrites/nitrates
-    if any(c in additive_codes for c in {"E102","E110","E129","E124","E122","E104"}):
+    if additive_codes & _SYNTH_COLOURS:
         s = min(s, 58)  # synthetic colours
-    if re.search(r"\b(msg|monosodium glutamate)\b", t) or any(c.replace("INS","").replace("E","")[:3] in MSG_LIKE for c in additive_codes):
+    if "msg" in tags or any(_bare_code(c)[:3] in _MSG_LIKE_BARE for c in additive_codes):
         s -= 5
-    if re.search(r"\b(palm oil|palmolein)\b", t):
+    if "palm_strict" in tags:
         s = min(s, 62)
 
     # Sparse-data guardrails: when most nutrition is missing, keep in mid band
-    known = [x for x in [energy_kj, sugar_g, sat_fat_g, sodium_mg, fiber_g, protein_g] if x is not None]
-    if len(known) <= 1:
+    if known_count <= 1:
         s = max(35, min(65, s))
 
     return max(0, min(100, int(round(s))))
 
+_SCORE_COLUMNS = ("energy_kj", "sugar_g", "sat_fat_g", "sodium_mg", "fiber_g", "protein_g", "fruit_pct")
+
+def _batch_base_scores(nutritions: List[Dict[str, Optional[float]]], beverages: List[bool]):
+    """_negative_points/_positive_points and the base score over all products at once (NaN = missing)."""
+    arr = np.array([[n.get(k) for k in _SCORE_COLUMNS] for n in nutritions], dtype=float).reshape(-1, 7)
+    energy, sugar, sat_fat, sodium, fiber, protein, fruit = arr.T
+    bev = np.asarray(beverages, dtype=bool)
+
+    def pts(x):
+        return np.where(np.isnan(x), 0.0, x)
+
+    with np.errstate(invalid="ignore"):  # NaN comparisons are expected here
+        neg = (pts(np.minimum(10.0, np.maximum(0.0, energy / 188.0)))
+               + pts(np.minimum(10.0, np.where(bev, sugar / 1.8, sugar / 2.8)))
+               + pts(np.minimum(10.0, sat_fat / 1.3))
+               + pts(np.minimum(10.0, sodium / 230.0)))
+        neg = np.minimum(30.0, neg)
+
+        fruit_pts = np.select([fruit >= 80, fruit >= 60, fruit >= 40, fruit >= 20, fruit >= 5],
+                              [5.0, 4.0, 3.0, 2.0, 1.0], 0.0)
+        pos = (pts(np.minimum(6.0, fiber / 1.2))
+               + pts(np.minimum(5.0, protein / 2.2))
+               + fruit_pts)
+        pos = np.minimum(16.0, pos)
+
+    known = (~np.isnan(arr[:, :6])).sum(axis=1)
+    return 78.0 - (neg * 2.0) + (pos * 1.8), known
+
+def compute_health_scores_batch(nutritions: List[Dict[str, Optional[float]]],
+                                additives_list: List[List[Dict[str, str]]],
+                                ingredients_texts: List[str],
+                                beverages: List[bool]) -> List[int]:
+    """
+    compute_health_score over many products (bulk import, cart grading). The nutrition
+    arithmetic runs vectorized with NumPy; text/additive penalties stay per product.
+    Falls back to the scalar path when NumPy isn't installed.
+    """
+    if not _HAS_NUMPY or not nutritions:
+        return [compute_health_score(n, a, t, b)
+                for n, a, t, b in zip(nutritions, additives_list, ingredients_texts, beverages)]
+    base, known = _batch_base_scores(nutritions, [bool(b) for b in beverages])
+    return [_finish_score(float(s), int(k), n, a, t, None)
+            for s, k, n, a, t in zip(base, known, nutritions, additives_list, ingredients_texts)]
+
+# Lower bound of each grade band, ascending; _GRADES[i] covers [_GRADE_BINS[i-1], _GRADE_BINS[i])
+_GRADE_BINS = (35, 50, 65, 75, 85)
+_GRADES = ("E", "D", "C", "B", "A", "A+")
+
 def grade_from_score(score: int) -> str:
-    if score >= 85: return "A+"
-    if score >= 75: return "A"
-    if score >= 65: return "B"
-    if score >= 50: return "C"
-    if score >= 35: return "D"
-    return "E"
+    return _GRADES[bisect_right(_GRADE_BINS, score)]
 
 # =========================
 # ---- Product Analysis ----
@@ -578,13 +808,17 @@ def grade_from_score(score: int) -> str:
 def summarize_pros_cons(nutrition: Dict[str, Optional[float]],
                         additives: List[Dict[str, str]],
                         ingredients_text: str,
-                        beverage: bool) -> Tuple[List[str], List[str]]:
+                        beverage: bool,
+                        text_lc: Optional[str] = None,
+                        kw_penalties: Optional[List[Tuple[str, int]]] = None) -> Tuple[List[str], List[str]]:
     positives: List[str] = []
     negatives: List[str] = []
 
-    if nutrition.get("fiber_g") and nutrition["fiber_g"] and nutrition["fiber_g"] >= 3:
+    fiber = nutrition.get("fiber_g")
+    if fiber and fiber >= 3:
         positives.append("High in fiber (≥3g/100g)")
-    if nutrition.get("protein_g") and nutrition["protein_g"] and nutrition["protein_g"] >= 5:
+    protein = nutrition.get("protein_g")
+    if protein and protein >= 5:
         positives.append("Good source of protein (≥5g/100g)")
 
     if traffic_light_sugar(nutrition.get("sugar_g"), beverage) == "high":
@@ -594,27 +828,21 @@ def summarize_pros_cons(nutrition: Dict[str, Optional[float]],
     if traffic_light_satfat(nutrition.get("sat_fat_g"), beverage) == "high":
         negatives.append("High in saturated fat")
 
-    if nutrition.get("trans_fat_g") and nutrition["trans_fat_g"] and nutrition["trans_fat_g"] > 0.1:
+    trans_fat = nutrition.get("trans_fat_g")
+    if trans_fat and trans_fat > 0.1:
         negatives.append("Contains trans fats (>0.1g/100g)")
 
     for a in additives or []:
         if (a.get("risk") or "").lower() == "avoid":
             negatives.append(f"Contains {a['name']} ({a['code']})")
-    for label, pen in _keyword_penalties(ingredients_text):
-        if pen < 0 and label not in negatives:
+    if kw_penalties is None:
+        kw_penalties = keyword_penalties(ingredients_text, text_lc)
+    for label, pen in kw_penalties:
+        if pen < 0:
             negatives.append(label)
 
-    # Deduplicate
-    seen_p, seen_n = set(), set()
-    pos, neg = [], []
-    for x in positives:
-        if x not in seen_p:
-            pos.append(x); seen_p.add(x)
-    for x in negatives:
-        if x not in seen_n:
-            neg.append(x); seen_n.add(x)
-
-    return pos, neg
+    # Deduplicate, keeping first-seen order
+    return list(dict.fromkeys(positives)), list(dict.fromkeys(negatives))
 
 def analyze_product(p: Dict[str, Any], barcode: str, debug: bool = False) -> Dict[str, Any]:
     nutr_raw = p.get("nutriments", {}) or {}
@@ -628,11 +856,16 @@ def analyze_product(p: Dict[str, Any], barcode: str, debug: bool = False) -> Dic
     )
     parsed = parse_ingredients(ingredients_text or (p.get("ingredients_text_debug") or ""))
 
-    additives_info = parsed["additives"] if parsed.get("additives") else classify_additives(extract_additives(parsed.get("ingredients_block","")))
+    additives_info = parsed["additives"]  # already classified from the ingredients block
     beverage = is_beverage(p)
 
-    score = compute_health_score(nutrition, additives_info, parsed.get("ingredients_block","") or ingredients_text, beverage)
-    positives, negatives = summarize_pros_cons(nutrition, additives_info, parsed.get("ingredients_block","") or ingredients_text, beverage)
+    scoring_text = parsed["ingredients_block"] or ingredients_text
+    text_lc = scoring_text.lower()
+    kw_penalties = keyword_penalties(scoring_text, text_lc)
+    score = compute_health_score(nutrition, additives_info, scoring_text, beverage,
+                                 ingredients_text_lc=text_lc, kw_penalties=kw_penalties)
+    positives, negatives = summarize_pros_cons(nutrition, additives_info, scoring_text, beverage,
+                                               text_lc, kw_penalties=kw_penalties)
 
     traffic = {
         "sugars": traffic_light_sugar(nutrition.get("sugar_g"), beverage),
@@ -643,7 +876,7 @@ def analyze_product(p: Dict[str, Any], barcode: str, debug: bool = False) -> Dic
     data = {
         "barcode": barcode,
         "name": p.get("product_name") or "Unknown",
-        "brand": (p.get("brands") or "").split(",")[0].strip() or None,
+        "brand": (p.get("brands") or "").partition(",")[0].strip() or None,
         "score": score,
         "grade": grade_from_score(score),
         "isBeverage": beverage,
@@ -668,38 +901,153 @@ def analyze_product(p: Dict[str, Any], barcode: str, debug: bool = False) -> Dic
         }
     return data
 
+ANALYSIS_CACHE_SIZE = 4096
+
+_analysis_cache: "OrderedDict[Tuple[str, Any, Any], str]" = OrderedDict()
+_analysis_lock = threading.Lock()
+
+def analyze_product_cached(p: Dict[str, Any], barcode: str) -> Dict[str, Any]:
+    """
+    analyze_product memoized on (barcode, rev, last_modified_t); OFF bumps these on every
+    edit, so a hit is always the analysis of identical product data.
+    Products without revision info are analyzed uncached.
+    """
+    rev, ts = p.get("rev"), p.get("last_modified_t")
+    if rev is None and ts is None:
+        return analyze_product(p, barcode)
+
+    key = (barcode, rev, ts)
+    with _analysis_lock:
+        hit = _analysis_cache.get(key)
+        if hit is not None:
+            _analysis_cache.move_to_end(key)
+    if hit is not None:
+        return json.loads(hit)  # fresh copy per caller
+
+    data = analyze_product(p, barcode)
+    with _analysis_lock:
+        _analysis_cache[key] = json.dumps(data)
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return data
+
 # =========================
 # ---- OFF Lookup ---------
 # =========================
 
-def _http_get(url: str, timeout: float = 6.0, retries: int = 1) -> Optional[requests.Response]:
-    headers = {"User-Agent": "ScoreMyFood/1.0 (+https://example.com)"}
-    for attempt in range(retries + 1):
-        try:
-            r = requests.get(url, timeout=timeout, headers=headers)
-            if r.status_code == 200:
-                return r
-            # Backoff on transient errors
-            if r.status_code in (429, 500, 502, 503, 504) and attempt < retries:
-                time.sleep(0.4 * (attempt + 1))
-                continue
+OFF_LOOKUP_WORKERS = int(os.getenv("OFF_LOOKUP_WORKERS", "16"))
+# Shared by every off_lookup_many call so concurrent batches can't multiply outbound connections
+_OFF_POOL = ThreadPoolExecutor(max_workers=OFF_LOOKUP_WORKERS, thread_name_prefix="off-lookup")
+OFF_CONNECT_TIMEOUT = 3.05
+OFF_READ_TIMEOUT = 7.5
+
+def _make_session() -> requests.Session:
+    # One pooled keep-alive session; retries/backoff on transient errors live in the adapter
+    retry = Retry(
+        total=2,
+        backoff_factor=0.1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,  # hand back the last response instead of raising
+        respect_retry_after_header=False,  # a large Retry-After would stall the worker; keep backoff bounded
+    )
+    session = requests.Session()
+    session.headers["User-Agent"] = "ScoreMyFood/1.0 (+https://example.com)"
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=retry))
+    return session
+
+_SESSION = _make_session()
+
+def _http_get(url: str, timeout: Tuple[float, float] = (OFF_CONNECT_TIMEOUT, OFF_READ_TIMEOUT)) -> Optional[requests.Response]:
+    # Any HTTP status is returned (off_lookup tells 404 from transient errors); None on network failure
+    try:
+        return _SESSION.get(url, timeout=timeout)
+    except Exception:
+        return None
+
+# Raw OFF products by barcode; products change on the scale of days, so an hour is safe.
+# Confirmed-missing barcodes are remembered briefly so repeated scans don't hammer OFF.
+OFF_CACHE_SIZE = int(os.getenv("OFF_CACHE_SIZE", "500"))
+OFF_CACHE_TTL = float(os.getenv("OFF_CACHE_TTL", "3600"))
+OFF_NEGATIVE_TTL = float(os.getenv("OFF_NEGATIVE_TTL", "300"))
+
+_NOT_FOUND = object()
+
+# The only product fields analyze_product / analyze_product_cached read. Full OFF products run to
+# hundreds of KB once parsed, so the cache keeps just these (a few KB, mostly nutriments).
+_OFF_PRODUCT_FIELDS = (
+    "product_name", "brands", "categories", "quantity", "image_front_url", "image_url",
+    "ingredients_text", "ingredients_text_en", "ingredients_text_fr", "ingredients_text_debug",
+    "nutriments", "rev", "last_modified_t",
+)
+_off_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # barcode → (expires_at, product | _NOT_FOUND)
+_off_lock = threading.Lock()
+
+def _off_cache_get(barcode: str) -> Any:
+    now = time.monotonic()
+    with _off_lock:
+        hit = _off_cache.get(barcode)
+        if hit is None:
             return None
-        except Exception:
-            if attempt < retries:
-                time.sleep(0.2 * (attempt + 1))
-                continue
+        if hit[0] <= now:
+            del _off_cache[barcode]
             return None
-    return None
+        _off_cache.move_to_end(barcode)
+        return hit[1]
+
+def _off_cache_set(barcode: str, value: Any, ttl: float) -> None:
+    if ttl <= 0:
+        return
+    with _off_lock:
+        _off_cache[barcode] = (time.monotonic() + ttl, value)
+        _off_cache.move_to_end(barcode)
+        while len(_off_cache) > OFF_CACHE_SIZE:
+            _off_cache.popitem(last=False)
+
+def _response_json(r: requests.Response) -> Any:
+    if _HAS_ORJSON:
+        try:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN literals; let the stdlib parser have a go
+    return r.json()
+
+def _fetch_off_product(barcode: str) -> Optional[Dict[str, Any]]:
+    hit = _off_cache_get(barcode)
+    if hit is not None:
+        return None if hit is _NOT_FOUND else hit
 
-def off_lookup(barcode: str) -> Optional[Dict[str, Any]]:
     url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    r = _http_get(url, timeout=7.5, retries=1)
-    if not r:
-        return None
+    r = _http_get(url)
+    if r is None or r.status_code not in (200, 404):
+        return None  # transient: don't cache
     try:
-        data = r.json()
+        data = _response_json(r)
     except Exception:
         return None
     if data.get("status") != 1 or "product" not in data:
+        _off_cache_set(barcode, _NOT_FOUND, OFF_NEGATIVE_TTL)
+        return None
+    full = data["product"]
+    product = {k: full[k] for k in _OFF_PRODUCT_FIELDS if k in full}
+    _off_cache_set(barcode, product, OFF_CACHE_TTL)
+    return product
+
+def off_lookup(barcode: str) -> Optional[Dict[str, Any]]:
+    product = _fetch_off_product(barcode)
+    if product is None:
         return None
-    return analyze_product(data["product"], barcode)
+    return analyze_product_cached(product, barcode)
+
+def off_lookup_many(barcodes: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    off_lookup for several barcodes at once, fetched concurrently over the shared session.
+    Results are in input order; duplicates are fetched once. At most OFF_LOOKUP_WORKERS
+    fetches run at a time per process, however many batches are in flight.
+    """
+    unique = list(dict.fromkeys(barcodes))
+    if len(unique) <= 1:
+        found = {b: off_lookup(b) for b in unique}
+    else:
+        found = dict(zip(unique, _OFF_POOL.map(off_lookup, unique)))
+    return [found[b] for b in barcodes]
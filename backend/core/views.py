@@ -1,19 +1,26 @@
 # backend/core/views.py
+import io
+import logging
 import os
-from PIL import Image
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from PIL import Image, ImageFile
+
+from django.core.cache import cache
 
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 
-# ----- Try robust local OCR if you added it; fallback to raw pytesseract -----
+logger = logging.getLogger(__name__)
+
+# ----- Robust local OCR (preprocessing + multi-PSM + cache); fallback to raw pytesseract -----
 try:
-    # recommended: ROI crop + cleaning + beverage heuristic
-    from core.ocr import extract_ingredients as local_extract, looks_like_beverage
-except Exception:
+    from core.ocr import extract_text_from_bytes as local_extract
+except Exception as e:
     local_extract = None
-    looks_like_beverage = None
+    logger.warning("local OCR pipeline unavailable, using raw pytesseract: %s: %s", type(e).__name__, e)
 
 # optional: UI prettifier; if missing, we still return the core fields
 try:
@@ -27,15 +34,33 @@ import pytesseract
 from core.utils import (
     parse_ingredients,
     off_lookup,
+    off_lookup_many,
     compute_health_score,
     summarize_pros_cons,
+    keyword_penalties,
     grade_from_score,
 )
 
+# Decode what arrived of a cut-off mobile upload instead of failing it into a client retry.
+# PIL only offers this as a process-wide flag, so it also covers core.ocr's PIL fallback decode
+# of the same upload and core.llm_ocr; all of them only ever see user uploads.
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
 # -------- utilities -----------------------------------------------------------
 
 MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "2200"))  # keep images reasonable
 
+PRODUCT_CACHE_TTL = int(os.getenv("PRODUCT_CACHE_TTL", "86400"))  # seconds; 0 disables
+MAX_BATCH_BARCODES = int(os.getenv("MAX_BATCH_BARCODES", "50"))
+_BARCODE_RE = re.compile(r"\d{4,14}")  # EAN/UPC/GTIN digits only; anything else never reaches the OFF URL
+
+# Raw-tesseract fallback: LSTM only, one uniform block of text (typical ingredient panel)
+TESSERACT_LANG = "eng"
+TESSERACT_CONFIG = "--oem 1 --psm 6 -c preserve_interword_spaces=1"
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "20"))
+# Bounded pool so concurrent uploads share the cores instead of oversubscribing them
+_OCR_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2))))
+
 def _empty_nutrition():
     return {
         "energy_kj": None,
@@ -56,39 +81,58 @@ def _downscale_if_huge(img: Image.Image) -> Image.Image:
         return img
     scale = MAX_DIMENSION / float(m)
     new_size = (int(w * scale), int(h * scale))
-    return img.resize(new_size, Image.BICUBIC)
+    return img.resize(new_size, Image.BILINEAR)  # tesseract doesn't benefit from bicubic
+
+def _prep_for_ocr(file) -> Image.Image:
+    """
+    Decode an upload straight to an OCR-sized grayscale image.
+    draft() lets libjpeg decode at 1/2, 1/4 or 1/8 scale instead of decoding every pixel
+    and shrinking afterwards; tesseract works on gray internally, so RGB is wasted.
+    """
+    img = Image.open(file)
+    w, h = img.size
+    m = max(w, h)
+    if m > MAX_DIMENSION:
+        # Ask for the aspect-preserved target so the long side never drops below MAX_DIMENSION
+        img.draft("L", (w * MAX_DIMENSION // m, h * MAX_DIMENSION // m))  # no-op for non-JPEG
+    return _downscale_if_huge(img.convert("L"))
 
-def _local_ocr_pipeline(img: Image.Image):
+def _local_ocr_pipeline(img: Image.Image, raw: bytes):
     """
-    Try robust local_extract -> pytesseract, never raises.
-    Returns (ingredients_text:str, beverage:bool, diagnostics:dict)
+    Try core.ocr on the upload bytes -> raw pytesseract on img, never raises.
+    Returns (ingredients_text:str, diagnostics:dict)
     """
-    text, diag = "", {"used_local_extract": False, "avg_conf": None}
-    # 1) robust helper if you added core/ocr.py
+    text, diag = "", {"used_local_extract": False, "local_extract_available": local_extract is not None,
+                      "avg_conf": None}
+    # 1) robust pipeline in core/ocr.py (decodes raw itself, with EXIF orientation)
     if local_extract is not None:
         try:
-            text, diag_local = local_extract(img)  # may return (text, diag)
-            diag.update({"used_local_extract": True, **(diag_local or {})})
-        except Exception:
-            pass
+            text = local_extract(raw)
+            diag["used_local_extract"] = bool(text)
+        except Exception as e:
+            logger.warning("local OCR failed, falling back to raw pytesseract: %s: %s", type(e).__name__, e)
+            text = ""
 
     # 2) fallback to raw pytesseract if needed
     if not text:
         try:
-            text = pytesseract.image_to_string(img) or ""
-            text = (text or "").strip()
+            future = _OCR_POOL.submit(
+                pytesseract.image_to_string, img,
+                lang=TESSERACT_LANG, config=TESSERACT_CONFIG, timeout=OCR_TIMEOUT,
+            )
+            text = (future.result(timeout=OCR_TIMEOUT + 5) or "").strip()
+        except FutureTimeout:
+            # Still queued behind other uploads: drop it so it doesn't run for a client that's gone.
+            # (A running job is bounded by tesseract's own timeout.)
+            future.cancel()
+            diag["pytesseract_error"] = "timeout"
+            text = ""
         except Exception as e:
             # don't raise; return empty and let downstream handle
-            diag["pytesseract_error"] = str(e)
+            diag["pytesseract_error"] = str(e) or type(e).__name__
             text = ""
 
-    # beverage heuristic if available
-    if looks_like_beverage is not None:
-        beverage = looks_like_beverage(None, None, text)
-    else:
-        beverage = False
-
-    return text, beverage, diag
+    return text, diag
 
 # -------- views ---------------------------------------------------------------
 
@@ -105,21 +149,26 @@ def ocr_analyze(request):
         return Response({"detail": "image is required (form field 'image')"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        img = Image.open(file).convert("RGB")
-        img = _downscale_if_huge(img)
+        raw = file.read()
+        img = _prep_for_ocr(io.BytesIO(raw))
     except Exception as e:
         return Response({"detail": f"invalid image: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
     # Local OCR only (no network)
-    ingredients_text, beverage, diag = _local_ocr_pipeline(img)
+    ingredients_text, diag = _local_ocr_pipeline(img, raw)
+    beverage = False  # a bare ingredients scan carries no beverage signal
 
     # Parse + score (nutrition stays empty unless you populate it elsewhere)
     parsed = parse_ingredients(ingredients_text or "")
     additives_info = parsed.get("additives", [])
     nutrition = _empty_nutrition()
 
-    score = compute_health_score(nutrition, additives_info, ingredients_text, beverage)
-    positives, negatives = summarize_pros_cons(nutrition, additives_info, ingredients_text, beverage)
+    text_lc = (ingredients_text or "").lower()
+    kw_penalties = keyword_penalties(ingredients_text, text_lc)
+    score = compute_health_score(nutrition, additives_info, ingredients_text, beverage,
+                                 ingredients_text_lc=text_lc, kw_penalties=kw_penalties)
+    positives, negatives = summarize_pros_cons(nutrition, additives_info, ingredients_text, beverage,
+                                               text_lc, kw_penalties=kw_penalties)
 
     # Optional UI block for nicer rendering
     ui = None
@@ -167,11 +216,45 @@ def product_lookup(_request, barcode: str):
     GET /api/product/<barcode>/
     Looks up OFF and returns standardized analysis.
     """
-    data = off_lookup(barcode)
-    if not data:
-        return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+    key = f"off:{barcode}"
+    data = cache.get(key) if PRODUCT_CACHE_TTL > 0 else None
+    if data is None:
+        data = off_lookup(barcode)
+        if not data:
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        if PRODUCT_CACHE_TTL > 0:
+            cache.set(key, data, PRODUCT_CACHE_TTL)
     return Response(data, status=status.HTTP_200_OK)
 
+@api_view(["GET"])
+def products_lookup(request):
+    """
+    GET /api/products/?barcodes=a,b,c
+    Batch form of product_lookup: cache hits are served together, misses are fetched concurrently.
+    Entries that aren't plain digit barcodes are never looked up and come back in not_found.
+    """
+    barcodes = list(dict.fromkeys(b.strip() for b in request.query_params.get("barcodes", "").split(",") if b.strip()))
+    if not barcodes:
+        return Response({"detail": "barcodes is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(barcodes) > MAX_BATCH_BARCODES:
+        return Response({"detail": f"at most {MAX_BATCH_BARCODES} barcodes per request"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    keys = {b: f"off:{b}" for b in barcodes if _BARCODE_RE.fullmatch(b)}
+    hits = cache.get_many(keys.values()) if PRODUCT_CACHE_TTL > 0 else {}
+    found = {b: hits[k] for b, k in keys.items() if k in hits}
+
+    missing = [b for b in keys if b not in found]
+    fetched = {b: d for b, d in zip(missing, off_lookup_many(missing)) if d}
+    if fetched and PRODUCT_CACHE_TTL > 0:
+        cache.set_many({keys[b]: d for b, d in fetched.items()}, PRODUCT_CACHE_TTL)
+    found.update(fetched)
+
+    return Response({
+        "products": [found[b] for b in barcodes if b in found],
+        "not_found": [b for b in barcodes if b not in found],
+    }, status=status.HTTP_200_OK)
+
 @api_view(["POST"])
 def ocr_analyze_text(request):
     """
@@ -185,18 +268,18 @@ def ocr_analyze_text(request):
     name = request.data.get("name") or "Ingredients scan"
     brand = request.data.get("brand") or None
 
-    # beverage guess if helper exists; else solid
-    if looks_like_beverage is not None:
-        beverage = looks_like_beverage(name, brand, ingredients_text)
-    else:
-        beverage = False
+    beverage = False  # scored as a solid; the text alone doesn't say otherwise
 
     parsed = parse_ingredients(ingredients_text)
     additives_info = parsed.get("additives", [])
     nutrition = _empty_nutrition()
 
-    score = compute_health_score(nutrition, additives_info, ingredients_text, beverage)
-    positives, negatives = summarize_pros_cons(nutrition, additives_info, ingredients_text, beverage)
+    text_lc = (ingredients_text or "").lower()
+    kw_penalties = keyword_penalties(ingredients_text, text_lc)
+    score = compute_health_score(nutrition, additives_info, ingredients_text, beverage,
+                                 ingredients_text_lc=text_lc, kw_penalties=kw_penalties)
+    positives, negatives = summarize_pros_cons(nutrition, additives_info, ingredients_text, beverage,
+                                               text_lc, kw_penalties=kw_penalties)
 
     ui = None
     if build_ui_block is not None: